@@ -204,6 +204,7 @@ TEMPLATES = [
                 'django.template.context_processors.static',
                 'django.template.context_processors.tz',
                 'django.contrib.messages.context_processors.messages',
+                'zanhu.users.context_processors.online_users',
             ],
         },
     },
@@ -264,6 +265,25 @@ CELERYD_TASK_TIME_LIMIT = 5 * 60  # 单个任务的最大运行时间5分钟
 # http://docs.celeryproject.org/en/latest/userguide/configuration.html#task-soft-time-limit
 # TODO: set to whatever value is adequate in your circumstances
 CELERYD_TASK_SOFT_TIME_LIMIT = 60  # 任务的软时间限制，超时候SoftTimeLimitExceeded异常将会被抛出
+# http://docs.celeryproject.org/en/latest/userguide/configuration.html#beat-schedule
+CELERY_BEAT_SCHEDULE = {
+    'publish-scheduled-articles': {
+        'task': 'zanhu.articles.tasks.publish_scheduled_articles',
+        'schedule': 60,  # 每分钟发表一次已到定时发布时间的文章
+    },
+    'archive-old-messages': {
+        'task': 'zanhu.messager.tasks.archive_old_messages',
+        'schedule': 24 * 60 * 60,  # 每天归档一次过期的私信
+    },
+    'purge-notifications': {
+        'task': 'zanhu.notifications.tasks.purge_notifications',
+        'schedule': 24 * 60 * 60,  # 每天清理一次过期的通知
+    },
+    'catch-up-search-index': {
+        'task': 'zanhu.search.tasks.catch_up_search_index',
+        'schedule': 10 * 60,  # 每10分钟按水位线增量更新一次索引
+    },
+}
 
 # django-allauth
 # ------------------------------------------------------------------------------
@@ -290,6 +310,39 @@ STATICFILES_FINDERS += ['compressor.finders.CompressorFinder']
 # Markdown相关设置 https://neutronx.github.io/django-markdownx/customization/#settings
 MARKDOWNX_UPLOAD_MAX_SIZE = 5 * 1024 * 1024  # 允许上传的最大图片大小为5MB
 MARKDOWNX_IMAGE_MAX_SIZE = {'size': (1000, 1000), 'quality': 100}  # 图片最大为1000*1000, 不压缩
+ARTICLE_LATEST_COMMENTS_NUM = 10  # 文章详情页缓存并展示的最新评论数量
+ARTICLE_AUTOSAVE_DELAY = 10  # 草稿自动保存延迟写入数据库的秒数，期间的多次保存合并为一次
+
+# 上传图片的衍生图，由Celery任务在上传后生成，模板中直接使用衍生图的URL，请求中不再计算缩略图
+IMAGE_DERIVATIVE_FORMAT = 'WEBP'  # 衍生图格式，体积比JPEG/PNG更小
+IMAGE_DERIVATIVE_QUALITY = 80  # 衍生图压缩质量
+ARTICLE_IMAGE_SIZES = {'card': (1920, 1080)}  # 文章图片的衍生图尺寸(宽, 高)
+USER_PICTURE_SIZES = {  # 头像的衍生图尺寸，宽为None时按高度等比缩放
+    'x40': (None, 40),
+    'x45': (None, 45),
+    'x50': (None, 50),
+    'x75': (None, 75),
+    'x180': (None, 180),
+}
+
+# 私信保留天数，更早的私信按会话压缩归档，查看历史记录时按需加载
+MESSAGE_RETENTION_DAYS = env.int('MESSAGE_RETENTION_DAYS', default=180)
+MESSAGE_ARCHIVE_CHUNK_SIZE = 100  # 每块归档的私信数量
+
+# 用户在线状态，WebSocket连接超过PRESENCE_TIMEOUT秒没有心跳视为断开
+PRESENCE_BACKEND = 'zanhu.users.presence.RedisPresence'
+PRESENCE_TIMEOUT = 90
+
+# 通知事件先进入队列，延迟NOTIFICATION_FLUSH_DELAY秒后由Celery任务批量写入和推送
+NOTIFICATION_FLUSH_DELAY = 1
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_COALESCE_WINDOW = 60 * 60  # 1小时内同一对象上的同类未读通知合并为一条
+NOTIFICATION_RECENT_ACTORS = 5  # 合并的通知只保存最近的几位触发者，只有他们重复触发时不重复计数
+NOTIFICATION_UNREAD_COUNT_TIMEOUT = 24 * 60 * 60  # 未读通知数缓存1天，过期后重新统计
+# 通知保留策略：已读通知保留NOTIFICATION_RETENTION_DAYS天，每个用户最多保留NOTIFICATION_MAX_PER_USER条（为0时不限制）
+NOTIFICATION_RETENTION_DAYS = env.int('NOTIFICATION_RETENTION_DAYS', default=90)
+NOTIFICATION_MAX_PER_USER = env.int('NOTIFICATION_MAX_PER_USER', default=1000)
+NOTIFICATION_PURGE_CHUNK_SIZE = 1000  # 每次删除的通知数量
 
 # ASGI server setup
 ASGI_APPLICATION = 'config.routing.application'
@@ -316,5 +369,13 @@ HAYSTACK_CONNECTIONS = {
 }
 
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 20  # 分页
-# 实时信号量处理器，模型类中数据增加、更新、删除时自动更新索引
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# 队列信号量处理器，模型类中数据增加、更新、删除时记录对象，由Celery任务批量更新索引
+HAYSTACK_SIGNAL_PROCESSOR = 'zanhu.search.signals.QueuedSignalProcessor'
+SEARCH_UPDATE_DELAY = 5  # 延迟5秒批量更新，期间同一对象的多次修改只更新一次
+SEARCH_UPDATE_BATCH_SIZE = 200
+SEARCH_RETRY_DELAY = 60  # 搜索引擎出错时，放回队列的对象1分钟后重试
+SEARCH_WATERMARK_OVERLAP = 60  # 增量更新时水位线回退的秒数
+SEARCH_CACHE_TIMEOUT = 60  # 搜索结果缓存1分钟
+SEARCH_AUTOCOMPLETE_MIN_LENGTH = 2  # 与Elasticsearch前缀索引的最短长度一致
+SEARCH_AUTOCOMPLETE_LIMIT = 10
+SEARCH_AUTOCOMPLETE_CACHE_TIMEOUT = 5 * 60
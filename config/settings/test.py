@@ -23,6 +23,16 @@ CACHES = {
     }
 }
 
+# 测试时在进程内记录在线状态
+PRESENCE_BACKEND = 'zanhu.users.presence.LocalPresence'
+
+# 测试时使用进程内的搜索引擎，不需要运行Elasticsearch
+HAYSTACK_CONNECTIONS = {
+    'default': {
+        'ENGINE': 'zanhu.search.backends.LocalEngine',
+    }
+}
+
 # PASSWORDS
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#password-hashers
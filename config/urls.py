@@ -18,13 +18,13 @@ urlpatterns = [
                   # 第三方应用
                   path('markdownx/', include('markdownx.urls')),
                   path('comments/', include('django_comments.urls')),
-                  path('search/', include('haystack.urls')),
                   # 开发的应用
                   path('news/', include('zanhu.news.urls', namespace='news')),
                   path('articles/', include('zanhu.articles.urls', namespace='articles')),
                   path('qa/', include('zanhu.qa.urls', namespace='qa')),
                   path('messages/', include('zanhu.messager.urls', namespace='messager')),
                   path('notifications/', include('zanhu.notifications.urls', namespace='notifications')),
+                  path('search/', include('zanhu.search.urls', namespace='search')),
               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG:
@@ -3,6 +3,7 @@
 # __author__ = '__AYC__'
 
 from django import forms
+from django.utils import timezone
 from markdownx.fields import MarkdownxFormField
 from zanhu.articles.models import Article
 
@@ -11,7 +12,19 @@ class ArticleForm(forms.ModelForm):
     status = forms.CharField(widget=forms.HiddenInput)  # 前端对用户隐藏
     edited = forms.BooleanField(widget=forms.HiddenInput, initial=False, required=False)  # 前端对用户隐藏
     content = MarkdownxFormField(label='文章')
+    publish_at = forms.DateTimeField(label='定时发布', required=False,
+                                     help_text='格式为2021-07-01 08:00，留空则立即发表')
 
     class Meta:
         model = Article
-        fields = ['title', 'image', 'content', 'edited', 'status', 'tags']
+        fields = ['title', 'image', 'content', 'edited', 'status', 'tags', 'publish_at']
+
+    def clean(self):
+        """设置了将来的定时发布时间时，先保存为草稿，到时由Celery任务发表"""
+        cleaned_data = super().clean()
+        publish_at = cleaned_data.get('publish_at')
+        if publish_at and publish_at > timezone.now():
+            cleaned_data['status'] = 'D'
+        else:
+            cleaned_data['publish_at'] = None
+        return cleaned_data
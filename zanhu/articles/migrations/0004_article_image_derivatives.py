@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0003_auto_20210715_1202'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='image_derivatives',
+            field=models.TextField(blank=True, null=True, verbose_name='图片衍生图'),
+        ),
+    ]
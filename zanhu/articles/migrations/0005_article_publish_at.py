@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0004_article_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='publish_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='定时发布时间'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.1.7 on 2026-10-19 10:48
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_comments(apps, schema_editor):
+    """统计已有文章的评论数"""
+    Article = apps.get_model('articles', 'Article')
+    Comment = apps.get_model('django_comments', 'Comment')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    content_type = ContentType.objects.filter(app_label='articles', model='article').first()
+    if content_type is None:
+        return
+    counted = Comment.objects.filter(content_type=content_type, is_public=True, is_removed=False).values(
+        'object_pk').annotate(num=Count('pk'))
+    for row in counted:
+        Article.objects.filter(pk=row['object_pk']).update(comment_count=row['num'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_comments', '0003_add_submit_date_index'),
+        ('articles', '0005_article_publish_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='评论数'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
@@ -2,12 +2,20 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
+import json
+
 from django.db import models
 from django.contrib.auth import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.functional import cached_property
 from slugify import slugify
 from taggit.managers import TaggableManager
 from markdownx.models import MarkdownxField
 from markdownx.utils import markdownify
+from django_comments import get_model as get_comment_model
+
+LATEST_COMMENTS_CACHE_KEY = 'articles:latest_comments:{}'
 
 
 class ArticleQuerySet(models.query.QuerySet):
@@ -21,6 +29,10 @@ class ArticleQuerySet(models.query.QuerySet):
         """返回草稿箱的文章"""
         return self.filter(status='D')
 
+    def get_scheduled(self):
+        """返回已到定时发布时间、尚未发表的文章"""
+        return self.get_drafts().filter(publish_at__lte=timezone.now())
+
     def get_counted_tags(self):
         """统计所有已发表的文章中，每一个标签的数量（数量大于0的）"""
         tag_dict = {}
@@ -44,11 +56,14 @@ class Article(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True, on_delete=models.SET_NULL,
                              related_name='author', verbose_name='作者')
     image = models.ImageField('文章图片', upload_to='articles_pictures/%Y/%m/%d/')
+    image_derivatives = models.TextField('图片衍生图', blank=True, null=True)  # JSON，由Celery任务生成
     slug = models.SlugField('URL别名', max_length=255)
     status = models.CharField('状态', max_length=1, choices=STATUS, default='D')
+    publish_at = models.DateTimeField('定时发布时间', blank=True, null=True, db_index=True)
     content = MarkdownxField('内容')
     edited = models.BooleanField('是否可编辑', default=False)
     tags = TaggableManager('标签', help_text='多个标签使用英文逗号隔开')
+    comment_count = models.PositiveIntegerField('评论数', default=0)  # 有新评论时加1，评论被删除时重新统计，列表页不再查询评论表
     created_at = models.DateTimeField('创建时间', auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField('更新时间', auto_now=True)
     objects = ArticleQuerySet.as_manager()  # 使用自定义查询结果集
@@ -67,6 +82,60 @@ class Article(models.Model):
         self.slug = slugify(self.title)
         super().save()
 
+    @cached_property
+    def image_urls(self):
+        """文章图片各尺寸衍生图的URL，尚未生成时为空字典"""
+        return json.loads(self.image_derivatives) if self.image_derivatives else {}
+
     def get_markdown(self):
         """将Markdown文本转换为HTML"""
         return markdownify(self.content)
+
+    def get_comment_queryset(self):
+        """文章的公开评论，最新的在前"""
+        return get_comment_model().objects.for_model(self).filter(
+            is_public=True, is_removed=False).select_related('user').order_by('-submit_date')
+
+    @staticmethod
+    def serialize_comment(comment):
+        """只保留页面展示需要的字段"""
+        return {
+            'username': comment.user.username if comment.user else comment.user_name,
+            'profile_name': comment.user.get_profile_name() if comment.user else comment.user_name,
+            'picture': (comment.user.picture_urls.get('x50') or comment.user.picture.url)
+            if comment.user and comment.user.picture else None,
+            'comment': comment.comment,
+            'submit_date': comment.submit_date
+        }
+
+    def get_latest_comments(self):
+        """最新的评论，优先从缓存中读取"""
+        comments = cache.get(LATEST_COMMENTS_CACHE_KEY.format(self.pk))
+        if comments is None:
+            comments = self.cache_latest_comments()
+        return comments
+
+    def cache_latest_comments(self):
+        """查询最新的评论并写入缓存，多保存一条用于判断是否还有更早的评论"""
+        qs = self.get_comment_queryset()[:settings.ARTICLE_LATEST_COMMENTS_NUM + 1]
+        comments = [self.serialize_comment(comment) for comment in qs]
+        cache.set(LATEST_COMMENTS_CACHE_KEY.format(self.pk), comments, None)
+        return comments
+
+    def get_comments_page(self, page=1):
+        """
+        分页获取评论，第一页读取最新评论的缓存，更早的评论按偏移量查询
+        :return: (当前页的评论, 是否还有更早的评论)
+        """
+        size = settings.ARTICLE_LATEST_COMMENTS_NUM
+        if page == 1:
+            comments = self.get_latest_comments()
+        else:
+            qs = self.get_comment_queryset()[(page - 1) * size:page * size + 1]
+            comments = [self.serialize_comment(comment) for comment in qs]
+        return comments[:size], len(comments) > size
+
+    def update_comment_count(self):
+        """按评论表重新统计评论数，评论被删除或隐藏时调用"""
+        count = get_comment_model().objects.for_model(self).filter(is_public=True, is_removed=False).count()
+        Article.objects.filter(pk=self.pk).update(comment_count=count)
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from slugify import slugify
+
+from zanhu.taskapp.celery import app
+from zanhu.helpers import make_image_derivatives
+from zanhu.articles.models import Article
+from zanhu.search.tasks import enqueue_search_update
+
+AUTOSAVE_CACHE_KEY = 'articles:autosave:{}'  # 自动保存的草稿内容
+AUTOSAVE_PENDING_KEY = 'articles:autosave:pending:{}'  # 已有排队中的自动保存任务
+
+
+@app.task(ignore_result=True)
+def process_article_image(article_id):
+    """上传文章图片后生成各尺寸衍生图，并记录衍生图的URL"""
+    article = Article.objects.filter(pk=article_id).only('image').first()
+    if article is None or not article.image:
+        return
+    derivatives = make_image_derivatives(article.image, settings.ARTICLE_IMAGE_SIZES)
+    # 使用update，不触发save方法；更新updated_at，索引中存储的图片URL由增量更新刷新
+    Article.objects.filter(pk=article_id).update(image_derivatives=json.dumps(derivatives), updated_at=timezone.now())
+
+
+@app.task(ignore_result=True)
+def publish_scheduled_articles(batch_size=100):
+    """由Celery beat周期执行，分批发表已到定时发布时间的文章"""
+    while True:
+        article_ids = list(Article.objects.get_scheduled().values_list('pk', flat=True)[:batch_size])
+        if not article_ids:
+            break
+        with transaction.atomic():
+            Article.objects.filter(pk__in=article_ids, status='D').update(
+                status='P', publish_at=None, updated_at=timezone.now())
+        # update不会触发信号，事务提交后将这批文章加入索引队列，与保存文章时一样由索引任务批量更新
+        enqueue_search_update(*[f'{Article._meta.label_lower}.{pk}' for pk in article_ids])
+
+
+@app.task(ignore_result=True)
+def save_article_draft(article_id):
+    """将缓存中最新的自动保存内容写入草稿，短时间内的多次自动保存只写一次数据库"""
+    draft = cache.get(AUTOSAVE_CACHE_KEY.format(article_id))
+    if draft is None:
+        return  # 已通过表单保存，或缓存已过期
+    qs = Article.objects.filter(pk=article_id, status='D')
+    # 使用update，不触发save方法及搜索索引的更新（草稿不需要被搜索到）
+    fields = {'content': draft['content'], 'updated_at': timezone.now()}
+    if draft['title']:
+        try:
+            with transaction.atomic():
+                qs.update(title=draft['title'], slug=slugify(draft['title']), **fields)
+            return
+        except IntegrityError:
+            pass  # 标题与其他文章重复时只保存内容
+    qs.update(**fields)
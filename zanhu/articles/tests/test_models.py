@@ -2,9 +2,21 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from django_comments import get_model as get_comment_model
+from django_comments.models import CommentFlag
+from django_comments.signals import comment_was_posted, comment_was_flagged
 from test_plus.test import TestCase
 
 from zanhu.articles.models import Article
+from zanhu.articles.tasks import publish_scheduled_articles
 
 
 class TestArticleModel(TestCase):
@@ -20,3 +32,92 @@ class TestArticleModel(TestCase):
     def test_return_value(self):
         """测试返回值"""
         pass
+
+
+class TestScheduledArticles(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.due = Article.objects.create(
+            user=self.user, title='到期的文章', content='内容', status='D',
+            publish_at=timezone.now() - timedelta(minutes=1))
+        self.future = Article.objects.create(
+            user=self.user, title='未到期的文章', content='内容', status='D',
+            publish_at=timezone.now() + timedelta(days=1))
+
+    def test_get_scheduled(self):
+        """只返回已到定时发布时间的草稿"""
+        self.assertIn(self.due, Article.objects.get_scheduled())
+        self.assertNotIn(self.future, Article.objects.get_scheduled())
+
+    def test_publish_scheduled_articles(self):
+        """发表到期的草稿，并通过索引队列更新搜索索引"""
+        with mock.patch('zanhu.articles.tasks.enqueue_search_update') as enqueue:
+            publish_scheduled_articles()
+        self.due.refresh_from_db()
+        self.future.refresh_from_db()
+        self.assertEqual(self.due.status, 'P')
+        self.assertIsNone(self.due.publish_at)
+        self.assertEqual(self.future.status, 'D')
+        enqueue.assert_called_once_with(f'articles.article.{self.due.pk}')
+
+
+class TestArticleComments(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.other_user = self.make_user('user02')
+        self.article = Article.objects.create(
+            user=self.user, title='有评论的文章', content='内容', status='P')
+        self.request = RequestFactory().post('/comments/post/')
+        self.request.user = self.other_user
+        # TestCase中事务不会提交，让on_commit回调立即执行以便检查缓存
+        patcher = mock.patch.object(transaction, 'on_commit', side_effect=lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cache.clear)
+
+    def post_comment(self, text):
+        """创建评论并发送评论成功的信号"""
+        comment = get_comment_model().objects.create(
+            content_object=self.article, site_id=settings.SITE_ID, user=self.other_user, comment=text)
+        with mock.patch('zanhu.articles.views.notification_handler'):
+            comment_was_posted.send(sender=comment.__class__, comment=comment, request=self.request)
+        return comment
+
+    def test_comment_count_increments(self):
+        self.post_comment('第一条评论')
+        self.post_comment('第二条评论')
+        self.article.refresh_from_db()
+        assert self.article.comment_count == 2
+        assert [c['comment'] for c in self.article.get_latest_comments()] == ['第二条评论', '第一条评论']
+
+    def test_recount_on_delete(self):
+        comment = self.post_comment('将被删除的评论')
+        self.post_comment('保留的评论')
+        comment.delete()
+        self.article.refresh_from_db()
+        assert self.article.comment_count == 1
+        assert [c['comment'] for c in self.article.get_latest_comments()] == ['保留的评论']
+
+    def test_recount_on_flag(self):
+        comment = self.post_comment('将被隐藏的评论')
+        comment.is_removed = True
+        comment.save()
+        flag = CommentFlag.objects.create(comment=comment, user=self.user, flag=CommentFlag.MODERATOR_DELETION)
+        comment_was_flagged.send(
+            sender=comment.__class__, comment=comment, flag=flag, created=True, request=self.request)
+        self.article.refresh_from_db()
+        assert self.article.comment_count == 0
+        assert self.article.get_latest_comments() == []
+
+    @override_settings(ARTICLE_LATEST_COMMENTS_NUM=2)
+    def test_get_comments_page(self):
+        for i in range(5):
+            self.post_comment(f'评论{i}')
+        comments, has_older = self.article.get_comments_page(1)
+        assert [c['comment'] for c in comments] == ['评论4', '评论3']
+        assert has_older
+        comments, has_older = self.article.get_comments_page(3)
+        assert [c['comment'] for c in comments] == ['评论0']
+        assert not has_older
@@ -13,6 +13,7 @@ urlpatterns = [
     path('', views.ArticleListView.as_view(), name='list'),
     path('write-new-article/', views.ArticleCreateView.as_view(), name='write_new'),
     path('drafts/', views.DraftListView.as_view(), name='drafts'),
+    path('autosave/<int:pk>/', views.autosave_draft, name='autosave_draft'),
     # 将文章详情页缓存5分钟
     path('<str:slug>/', cache_page(60 * 5)(views.ArticleDetailView.as_view()), name='article'),
     path('edit/<int:pk>/', views.ArticleEditView.as_view(), name='edit_article'),
@@ -6,13 +6,25 @@ from django.views.generic import CreateView, ListView, UpdateView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
-from django_comments.signals import comment_was_posted
+from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_http_methods
+from django.db.models.signals import post_delete
+from django_comments import get_model as get_comment_model
+from django_comments.signals import comment_was_posted, comment_was_flagged
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 
 from zanhu.articles.models import Article
 from zanhu.articles.forms import ArticleForm
-from zanhu.helpers import AuthorRequiredMixin
+from zanhu.articles.tasks import (process_article_image, save_article_draft,
+                                  AUTOSAVE_CACHE_KEY, AUTOSAVE_PENDING_KEY)
+from zanhu.helpers import ajax_required, AuthorRequiredMixin
 from zanhu.notifications.views import notification_handler
 
 
@@ -53,7 +65,11 @@ class ArticleCreateView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         # 将用户传递给表单实例
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # 事务提交后异步生成图片衍生图
+        article_id = self.object.pk
+        transaction.on_commit(lambda: process_article_image.delay(article_id))
+        return response
 
     def get_success_url(self):
         """文章创建成功后跳转"""
@@ -70,6 +86,17 @@ class ArticleDetailView(LoginRequiredMixin, DetailView):
         """添加select_related以减少SQL查询次数"""
         return Article.objects.select_related('user').filter(slug=self.kwargs['slug'])
 
+    def get_context_data(self, **kwargs):
+        """评论分页，?comments_page=N 查看更早的评论"""
+        context = super().get_context_data(**kwargs)
+        try:
+            page = max(int(self.request.GET.get('comments_page', 1)), 1)
+        except ValueError:
+            page = 1
+        context['comments'], context['has_older_comments'] = self.object.get_comments_page(page)
+        context['comments_page'] = page
+        return context
+
 
 class ArticleEditView(LoginRequiredMixin, AuthorRequiredMixin, UpdateView):
     """编辑文章（只能编辑自己的文章）"""
@@ -80,13 +107,39 @@ class ArticleEditView(LoginRequiredMixin, AuthorRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        cache.delete(AUTOSAVE_CACHE_KEY.format(form.instance.pk))  # 以表单提交的内容为准，丢弃排队中的自动保存
+        image_changed = 'image' in form.changed_data
+        if image_changed:
+            form.instance.image_derivatives = None  # 旧的衍生图作废，生成新的衍生图前使用原图
+        response = super().form_valid(form)
+        if image_changed:
+            article_id = self.object.pk
+            transaction.on_commit(lambda: process_article_image.delay(article_id))
+        return response
 
     def get_success_url(self):
         messages.success(self.request, message=self.message)
         return reverse('articles:article', kwargs={'slug': self.get_object().slug})  # 跳转到文章详情页
 
 
+@login_required
+@ajax_required
+@require_http_methods(['POST'])
+def autosave_draft(request, pk):
+    """自动保存草稿，AJAX POST请求。内容先写入缓存，延迟合并写入数据库"""
+    get_object_or_404(Article, pk=pk, user=request.user, status='D')
+    draft = {
+        'title': request.POST.get('title', '').strip(),
+        'content': request.POST.get('content', '')
+    }
+    cache.set(AUTOSAVE_CACHE_KEY.format(pk), draft, 60 * 60)
+    delay = settings.ARTICLE_AUTOSAVE_DELAY
+    # 同一篇草稿在延迟时间内只排队一个任务，任务执行时读取缓存中最新的内容
+    if cache.add(AUTOSAVE_PENDING_KEY.format(pk), True, delay):
+        save_article_draft.apply_async(args=(pk,), countdown=delay)
+    return JsonResponse({'status': 'queued'})
+
+
 def notify_comment(**kwargs):
     """文章有评论时通知作者"""
     actor = kwargs['request'].user
@@ -94,4 +147,25 @@ def notify_comment(**kwargs):
     notification_handler(actor, obj.user, 'C', obj)
 
 
+def update_comment_stats(**kwargs):
+    """文章有评论时评论数加1，并在事务提交后刷新最新评论的缓存"""
+    obj = kwargs['comment'].content_object
+    if not isinstance(obj, Article):
+        return
+    Article.objects.filter(pk=obj.pk).update(comment_count=F('comment_count') + 1)
+    transaction.on_commit(obj.cache_latest_comments)
+
+
+def recount_comments(**kwargs):
+    """评论被删除、被管理员隐藏或重新审核通过时，重新统计文章的评论数并刷新最新评论的缓存"""
+    comment = kwargs.get('comment') or kwargs['instance']
+    obj = comment.content_object
+    if isinstance(obj, Article):
+        obj.update_comment_count()
+        transaction.on_commit(obj.cache_latest_comments)
+
+
 comment_was_posted.connect(receiver=notify_comment)
+comment_was_posted.connect(receiver=update_comment_stats)
+comment_was_flagged.connect(receiver=recount_comments)
+post_delete.connect(receiver=recount_comments, sender=get_comment_model())
@@ -2,8 +2,13 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
+import os
+from io import BytesIO
 from functools import wraps
 
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.http import HttpResponseBadRequest
 from django.views.generic import View
 from django.core.exceptions import PermissionDenied
@@ -29,3 +34,34 @@ class AuthorRequiredMixin(View):
         if self.get_object().user.username != self.request.user.username:
             raise PermissionDenied
         return super().dispatch(request, *args, **kwargs)
+
+
+def make_image_derivatives(image_file, sizes):
+    """
+    生成上传图片的各尺寸衍生图，去除EXIF等元数据并转换为更高效的格式
+    :param image_file: FieldFile ImageField中保存的图片
+    :param sizes: dict 衍生图名称及尺寸(宽, 高)，宽或高为None时按比例缩放
+    :return: dict 衍生图名称及URL
+    """
+    image_format = getattr(settings, 'IMAGE_DERIVATIVE_FORMAT', 'WEBP')
+    quality = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80)
+    storage = image_file.storage
+    with storage.open(image_file.name, 'rb') as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original)  # 先按EXIF方向旋转，保存时不再携带任何元数据
+        original.load()
+    if image_format == 'JPEG' or original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGB' if image_format == 'JPEG' else 'RGBA')
+
+    root = os.path.join('derivatives', os.path.splitext(image_file.name)[0])
+    derivatives = {}
+    for name, (width, height) in sizes.items():
+        image = original.copy()
+        image.thumbnail((width or original.width, height or original.height), Image.LANCZOS)  # 只缩小不放大
+        buffer = BytesIO()
+        image.save(buffer, image_format, quality=quality, optimize=True)
+        path = f'{root}_{name}.{image_format.lower()}'
+        if storage.exists(path):
+            storage.delete(path)  # 重新上传时覆盖旧的衍生图
+        derivatives[name] = storage.url(storage.save(path, ContentFile(buffer.getvalue())))
+    return derivatives
@@ -3,7 +3,15 @@
 # __author__ = '__AYC__'
 
 import json
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from zanhu.messager.models import Message
+from zanhu.users.presence import presence
 
 
 class MessagesConsumer(AsyncWebsocketConsumer):
@@ -16,11 +24,49 @@ class MessagesConsumer(AsyncWebsocketConsumer):
         else:
             await self.channel_layer.group_add(self.scope['user'].username, self.channel_name)
             await self.accept()
+            await sync_to_async(presence.connect)(self.scope['user'].username, self.channel_name)
 
     async def receive(self, text_data=None, bytes_data=None):
-        """接收私信"""
-        await self.send(text_data=json.dumps(text_data))
+        """接收前端通过WebSocket直接发送的私信，保存后推送给接收者并回复确认"""
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            # 不是JSON对象的数据回复错误，不中断连接
+            await self.send(text_data=json.dumps({'type': 'error', 'client_id': None}))
+            return
+        if data.get('type') == 'heartbeat':
+            await sync_to_async(presence.heartbeat)(self.scope['user'].username, self.channel_name)
+            return
+        client_id = data.get('client_id')  # 前端生成的消息ID，用于匹配确认
+        recipient = data.get('to')
+        event = await self.save_message(recipient, data.get('message', ''))
+        if event is None:
+            await self.send(text_data=json.dumps({'type': 'error', 'client_id': client_id}))
+            return
+        await self.channel_layer.group_send(recipient, {'type': 'chat.message', 'message': event})
+        await self.send(text_data=json.dumps({'type': 'ack', 'client_id': client_id, 'message': event}))
+
+    async def chat_message(self, event):
+        """将其他用户发来的私信推送给前端"""
+        await self.send(text_data=json.dumps({'type': 'message', 'message': event['message']}))
 
     async def disconnect(self, code):
         """离开聊天组"""
         await self.channel_layer.group_discard(self.scope['user'].username, self.channel_name)
+        if not self.scope['user'].is_anonymous:
+            await sync_to_async(presence.disconnect)(self.scope['user'].username, self.channel_name)
+
+    @database_sync_to_async
+    def save_message(self, recipient_username, text):
+        """在线程池中保存私信，返回私信事件，私信无效时返回None"""
+        sender = self.scope['user']
+        if not isinstance(recipient_username, str) or not isinstance(text, str) or not text.strip():
+            return None
+        recipient = get_user_model().objects.filter(username=recipient_username).first()
+        if recipient is None or recipient.pk == sender.pk:
+            return None
+        with transaction.atomic():
+            msg = Message.objects.create(sender=sender, recipient=recipient, message=text)
+        return msg.to_event()
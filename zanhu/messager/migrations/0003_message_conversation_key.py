@@ -0,0 +1,33 @@
+# Generated by Django 2.1.7 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+def fill_conversation_key(apps, schema_editor):
+    """为已有的私信生成会话标识"""
+    Message = apps.get_model('messager', 'Message')
+    pairs = Message.objects.filter(sender__isnull=False, recipient__isnull=False).values_list(
+        'sender_id', 'recipient_id').distinct()
+    for sender_id, recipient_id in pairs:
+        Message.objects.filter(sender_id=sender_id, recipient_id=recipient_id).update(
+            conversation_key='{}-{}'.format(*sorted([sender_id, recipient_id])))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messager', '0002_auto_20210715_1202'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation_key',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='会话标识'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation_key', 'created_at'], name='message_conversation_idx'),
+        ),
+        migrations.RunPython(fill_conversation_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.1.7 on 2026-10-19 13:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_conversations(apps, schema_editor):
+    """根据已有的私信生成会话记录"""
+    Message = apps.get_model('messager', 'Message')
+    Conversation = apps.get_model('messager', 'Conversation')
+    keys = Message.objects.filter(conversation_key__isnull=False).values_list(
+        'conversation_key', flat=True).distinct()
+    for key in keys:
+        messages = Message.objects.filter(conversation_key=key)
+        last = messages.latest('created_at')
+        for owner_id, other_id in ((last.sender_id, last.recipient_id), (last.recipient_id, last.sender_id)):
+            Conversation.objects.create(
+                owner_id=owner_id,
+                other_id=other_id,
+                last_message=last.message,
+                last_message_at=last.created_at,
+                unread_count=messages.filter(recipient_id=owner_id, unread=True).count()
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messager', '0003_message_conversation_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message', models.TextField(blank=True, null=True, verbose_name='最后一条私信')),
+                ('last_message_at', models.DateTimeField(verbose_name='最后私信时间')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='未读数')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='会话对方')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL, verbose_name='所属用户')),
+            ],
+            options={
+                'verbose_name': '私信会话',
+                'verbose_name_plural': '私信会话',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['owner', '-last_message_at'], name='conversation_inbox_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversation',
+            unique_together={('owner', 'other')},
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
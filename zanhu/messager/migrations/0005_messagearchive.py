@@ -0,0 +1,28 @@
+# Generated by Django 2.1.7 on 2026-10-19 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messager', '0004_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_key', models.CharField(db_index=True, max_length=64, verbose_name='会话标识')),
+                ('first_created_at', models.DateTimeField(verbose_name='最早私信时间')),
+                ('last_created_at', models.DateTimeField(verbose_name='最晚私信时间')),
+                ('message_count', models.PositiveIntegerField(verbose_name='私信数量')),
+                ('data', models.BinaryField(verbose_name='压缩的私信')),
+            ],
+            options={
+                'verbose_name': '私信归档',
+                'verbose_name_plural': '私信归档',
+            },
+        ),
+    ]
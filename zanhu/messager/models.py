@@ -2,36 +2,69 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
+import json
 import uuid
+import zlib
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 
 class MessageQuerySet(models.query.QuerySet):
     """自定义查询集"""
 
     def get_conversation(self, sender, recipient):
-        """用户间的私信会话"""
-        qs_one = self.filter(sender=sender, recipient=recipient).select_related('sender', 'recipient')
-        qs_two = self.filter(sender=recipient, recipient=sender).select_related('sender', 'recipient')
-        return qs_one.union(qs_two).order_by('created_at')
+        """用户间的私信会话，通过会话标识走(conversation_key, created_at)联合索引"""
+        return self.filter(conversation_key=Message.make_conversation_key(sender.pk, recipient.pk)).select_related(
+            'sender', 'recipient').order_by('created_at')
 
-    def get_most_recent_conversation(self, recipient):
-        """获取最近一次私信的用户"""
-        try:
-            qs_sent = self.filter(sender=recipient).select_related('sender', 'recipient')
-            qs_received = self.filter(recipient=recipient).select_related('sender', 'recipient')
-            qs = qs_sent.union(qs_received).latest('created_at')
-            # 如果登录用户有发送消息，返回消息的接收者
-            if qs.sender == recipient:
-                return recipient
-            # 否则返回消息的发送者
-            return qs.sender
-        except self.model.DoesNotExist:
-            # 如果模型实例不存在，则返回当前登录的用户
-            return get_user_model().objects.get(username=recipient.username)
+    def get_conversation_page(self, sender, recipient, before=None, limit=20):
+        """
+        键集分页获取会话中的一页私信，按时间正序返回
+        :param sender: 会话的一方
+        :param recipient: 会话的另一方
+        :param before: 上一页最早一条私信的uuid_id，为None时返回最新的一页
+        :param limit: int 每页数量
+        :return: (私信列表, 是否还有更早的私信)
+        """
+        qs = self.get_conversation(sender, recipient).order_by('-created_at', '-uuid_id')
+        if before:
+            cursor = self.filter(uuid_id=before).values('created_at').first()
+            if cursor is None:
+                return [], False
+            qs = qs.filter(models.Q(created_at__lt=cursor['created_at']) |
+                           models.Q(created_at=cursor['created_at'], uuid_id__lt=before))
+        messages = list(qs[:limit + 1])  # 多取一条，判断是否还有更早的私信
+        return messages[:limit][::-1], len(messages) > limit
+
+    def get_conversation_history(self, sender, recipient, cursor=None, limit=20):
+        """
+        分页获取会话历史，先读取私信表，读完后再逐块读取已归档的私信
+        :param sender: 会话的一方
+        :param recipient: 会话的另一方
+        :param cursor: str 游标，'m:<uuid_id>'读取私信表，'a:<归档ID>'读取归档表，'a:'从最新的归档开始
+        :param limit: int 每页数量（归档按块读取，不受此限制）
+        :return: (私信列表, 下一页的游标，没有更早的私信时为None)
+        """
+        if cursor is None or cursor.startswith('m:'):
+            messages, has_more = self.get_conversation_page(
+                sender, recipient, before=cursor[2:] if cursor else None, limit=limit)
+            if has_more:
+                return messages, f'm:{messages[0].uuid_id}'
+            if messages:
+                has_archive = MessageArchive.objects.get_conversation(sender, recipient).exists()
+                return messages, 'a:' if has_archive else None
+            cursor = 'a:'  # 私信表中已没有更早的私信，直接读取归档
+        archives = MessageArchive.objects.get_conversation(sender, recipient)
+        if cursor[2:]:
+            archives = archives.filter(pk__lt=cursor[2:])
+        archives = list(archives[:2])  # 多取一块，判断是否还有更早的归档
+        if not archives:
+            return [], None
+        return archives[0].get_messages(), (f'a:{archives[0].pk}' if len(archives) > 1 else None)
 
 
 class Message(models.Model):
@@ -42,6 +75,8 @@ class Message(models.Model):
     recipient = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='received_messages',
                                   blank=True, null=True, on_delete=models.SET_NULL, verbose_name='接收者')
     message = models.TextField('内容', blank=True, null=True)
+    # 会话标识，由双方用户主键按大小排序拼接而成，无论谁发送都相同
+    conversation_key = models.CharField('会话标识', max_length=64, blank=True, null=True)
     unread = models.BooleanField('是否未读', default=True, db_index=True)
     created_at = models.DateTimeField('创建时间', auto_now_add=True, db_index=True)
     objects = MessageQuerySet.as_manager()
@@ -50,12 +85,196 @@ class Message(models.Model):
         verbose_name = '私信'
         verbose_name_plural = verbose_name
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['conversation_key', 'created_at'], name='message_conversation_idx'),
+        ]
 
     def __str__(self):
         return self.message
 
+    @staticmethod
+    def make_conversation_key(user_one_id, user_two_id):
+        """两个用户之间会话的标识"""
+        return '{}-{}'.format(*sorted([user_one_id, user_two_id]))
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        """重写save方法，自动生成会话标识"""
+        adding = self._state.adding
+        if not self.conversation_key and self.sender_id and self.recipient_id:
+            self.conversation_key = self.make_conversation_key(self.sender_id, self.recipient_id)
+        super().save(force_insert, force_update, using, update_fields)
+        if adding and self.sender_id and self.recipient_id:
+            Conversation.objects.record_message(self)
+
+    def to_event(self):
+        """私信事件的精简结构，通过频道层推送后由前端渲染"""
+        sender = self.sender
+        picture = ''
+        if sender.picture:
+            picture = sender.picture_urls.get('x45') or sender.picture.url
+        return {
+            'id': str(self.uuid_id),
+            'sender': sender.username,
+            'sender_name': sender.get_profile_name(),
+            'picture': picture,
+            'text': self.message,
+            'created_at': timezone.localtime(self.created_at).strftime('%Y-%m-%d %H:%M:%S')
+        }
+
     def mark_as_read(self):
         """标记消息为已读"""
         if self.unread:
             self.unread = False
-            self.save()
+            self.save(update_fields=['unread'])
+
+
+class ConversationQuerySet(models.query.QuerySet):
+    """自定义查询集"""
+
+    def get_inbox(self, owner):
+        """用户的会话列表，最近有私信的会话在前"""
+        return self.filter(owner=owner).select_related('other').order_by('-last_message_at')
+
+    def get_unread_count(self, owner):
+        """用户所有会话的未读私信总数"""
+        return self.filter(owner=owner).aggregate(total=models.Sum('unread_count'))['total'] or 0
+
+    def mark_as_read(self, owner, other):
+        """
+        打开会话时标记已读：清零会话的未读数，并用一条UPDATE将对方发来的未读私信全部标为已读
+        :param owner: 阅读会话的用户
+        :param other: 会话的另一方
+        :return: int 是否有未读的私信被标为已读
+        """
+        updated = self.filter(owner=owner, other=other, unread_count__gt=0).update(unread_count=0)
+        if updated:
+            Message.objects.filter(conversation_key=Message.make_conversation_key(owner.pk, other.pk),
+                                   recipient=owner, unread=True).update(unread=False)
+        return updated
+
+    def record_message(self, message):
+        """新私信产生时，更新发送者和接收者双方的会话记录"""
+        self._upsert(message.sender_id, message.recipient_id, message, unread=False)
+        self._upsert(message.recipient_id, message.sender_id, message, unread=True)
+
+    def _upsert(self, owner_id, other_id, message, unread):
+        """更新一方的会话记录，不存在时创建"""
+        fields = {'last_message': message.message, 'last_message_at': message.created_at}
+        if unread:
+            fields['unread_count'] = models.F('unread_count') + 1
+        if self.filter(owner_id=owner_id, other_id=other_id).update(**fields):
+            return
+        fields['unread_count'] = 1 if unread else 0
+        try:
+            with transaction.atomic():
+                self.create(owner_id=owner_id, other_id=other_id, **fields)
+        except IntegrityError:
+            # 并发创建时另一个请求已插入记录，改为更新
+            if unread:
+                fields['unread_count'] = models.F('unread_count') + 1
+            else:
+                del fields['unread_count']
+            self.filter(owner_id=owner_id, other_id=other_id).update(**fields)
+
+
+class Conversation(models.Model):
+    """用户的私信会话摘要，私信列表页只需读取此表"""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='conversations',
+                              on_delete=models.CASCADE, verbose_name='所属用户')
+    other = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+',
+                              on_delete=models.CASCADE, verbose_name='会话对方')
+    last_message = models.TextField('最后一条私信', blank=True, null=True)
+    last_message_at = models.DateTimeField('最后私信时间')
+    unread_count = models.PositiveIntegerField('未读数', default=0)
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = '私信会话'
+        verbose_name_plural = verbose_name
+        unique_together = ('owner', 'other')
+        indexes = [
+            models.Index(fields=['owner', '-last_message_at'], name='conversation_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.owner} - {self.other}'
+
+
+class MessageArchiveQuerySet(models.query.QuerySet):
+    """自定义查询集"""
+
+    def get_conversation(self, sender, recipient):
+        """会话的归档，最新的在前"""
+        return self.filter(conversation_key=Message.make_conversation_key(sender.pk, recipient.pk)).order_by('-pk')
+
+    def archive_conversation(self, conversation_key, cutoff, chunk_size=100):
+        """
+        将会话中早于截止时间的私信按时间顺序分块压缩归档，并从私信表中删除
+        :param conversation_key: str 会话标识
+        :param cutoff: datetime 截止时间
+        :param chunk_size: int 每块归档的私信数量
+        :return: int 归档的私信数量
+        """
+        archived = 0
+        while True:
+            with transaction.atomic():
+                messages = list(Message.objects.filter(
+                    conversation_key=conversation_key, created_at__lt=cutoff).order_by(
+                    'created_at', 'uuid_id')[:chunk_size])
+                if not messages:
+                    return archived
+                self.create(
+                    conversation_key=conversation_key,
+                    first_created_at=messages[0].created_at,
+                    last_created_at=messages[-1].created_at,
+                    message_count=len(messages),
+                    data=MessageArchive.compress(messages)
+                )
+                Message.objects.filter(pk__in=[m.pk for m in messages]).delete()
+            archived += len(messages)
+
+
+class MessageArchive(models.Model):
+    """归档的历史私信，按会话分块压缩存储，让私信表只保留近期的数据"""
+    conversation_key = models.CharField('会话标识', max_length=64, db_index=True)
+    first_created_at = models.DateTimeField('最早私信时间')
+    last_created_at = models.DateTimeField('最晚私信时间')
+    message_count = models.PositiveIntegerField('私信数量')
+    data = models.BinaryField('压缩的私信')  # zlib压缩的JSON
+    objects = MessageArchiveQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = '私信归档'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f'{self.conversation_key}: {self.message_count}'
+
+    @staticmethod
+    def compress(messages):
+        """将私信序列化为JSON并压缩"""
+        rows = [{
+            'id': str(m.uuid_id),
+            'sender': m.sender_id,
+            'recipient': m.recipient_id,
+            'message': m.message,
+            'unread': m.unread,
+            'created_at': m.created_at.isoformat()
+        } for m in messages]
+        return zlib.compress(json.dumps(rows, ensure_ascii=False).encode('utf-8'))
+
+    def get_messages(self):
+        """解压归档，返回按时间正序排列的私信实例（不保存到数据库），发送者和接收者一次查询"""
+        rows = json.loads(zlib.decompress(bytes(self.data)).decode('utf-8'))
+        user_ids = {row[key] for row in rows for key in ('sender', 'recipient')} - {None}
+        users = get_user_model().objects.in_bulk(user_ids)
+        return [Message(
+            uuid_id=uuid.UUID(row['id']),
+            sender=users.get(row['sender']),
+            recipient=users.get(row['recipient']),
+            message=row['message'],
+            unread=row['unread'],
+            conversation_key=self.conversation_key,
+            created_at=parse_datetime(row['created_at'])
+        ) for row in rows]
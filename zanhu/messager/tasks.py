@@ -0,0 +1,22 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from zanhu.taskapp.celery import app
+from zanhu.messager.models import Message, MessageArchive
+
+
+@app.task(ignore_result=True)
+def archive_old_messages():
+    """由Celery beat周期执行，将超过保留天数的私信按会话压缩归档"""
+    cutoff = timezone.now() - timedelta(days=settings.MESSAGE_RETENTION_DAYS)
+    conversation_keys = Message.objects.filter(
+        created_at__lt=cutoff, conversation_key__isnull=False).values_list('conversation_key', flat=True).distinct()
+    for conversation_key in conversation_keys.iterator():
+        MessageArchive.objects.archive_conversation(
+            conversation_key, cutoff, chunk_size=settings.MESSAGE_ARCHIVE_CHUNK_SIZE)
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import json
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase
+
+from zanhu.messager.consumers import MessagesConsumer
+from zanhu.messager.models import Message
+
+
+class FakeChannelLayer:
+    """记录group_send的调用，不需要运行Redis"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+
+class TestMessagesConsumer(TransactionTestCase):
+    """私信在线程池中保存，使用TransactionTestCase让其他线程的数据库连接能读到测试数据"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user01', password='password')
+        self.other_user = get_user_model().objects.create_user('user02', password='password')
+        self.consumer = MessagesConsumer({'type': 'websocket', 'user': self.user})
+        self.consumer.channel_layer = FakeChannelLayer()
+        self.frames = []
+
+        async def send(text_data=None, bytes_data=None, close=False):
+            self.frames.append(json.loads(text_data))
+
+        self.consumer.send = send
+
+    def receive(self, data):
+        async_to_sync(self.consumer.receive)(text_data=json.dumps(data))
+        return self.frames[-1]
+
+    def test_ack(self):
+        """私信保存后推送给接收者，并带上client_id回复确认"""
+        frame = self.receive({'client_id': 1, 'to': 'user02', 'message': '你好'})
+        self.assertEqual(frame['type'], 'ack')
+        self.assertEqual(frame['client_id'], 1)
+        self.assertEqual(frame['message']['text'], '你好')
+        self.assertEqual(Message.objects.filter(sender=self.user, recipient=self.other_user).count(), 1)
+        group, event = self.consumer.channel_layer.sent[0]
+        self.assertEqual(group, 'user02')
+        self.assertEqual(event['message'], frame['message'])
+
+    def test_error(self):
+        """私信无效时带上client_id回复错误，不保存也不推送"""
+        for client_id, data in enumerate([
+            {'to': 'nobody', 'message': '你好'},
+            {'to': 'user01', 'message': '发给自己'},
+            {'to': 'user02', 'message': '  '},
+        ]):
+            frame = self.receive(dict(data, client_id=client_id))
+            self.assertEqual(frame, {'type': 'error', 'client_id': client_id})
+        self.assertFalse(Message.objects.exists())
+        self.assertEqual(self.consumer.channel_layer.sent, [])
+
+    def test_invalid_payload(self):
+        """不是JSON对象的数据回复错误"""
+        self.assertEqual(self.receive(['你好']), {'type': 'error', 'client_id': None})
+        async_to_sync(self.consumer.receive)(text_data='不是JSON')
+        self.assertEqual(self.frames[-1], {'type': 'error', 'client_id': None})
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from django.utils import timezone
+from test_plus.test import TestCase
+
+from zanhu.messager.models import Message, Conversation, MessageArchive
+
+
+class TestMessageModels(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.other_user = self.make_user('user02')
+        self.third_user = self.make_user('user03')
+        self.messages = [Message.objects.create(
+            sender=self.user if i % 2 else self.other_user,
+            recipient=self.other_user if i % 2 else self.user,
+            message=f'私信{i}'
+        ) for i in range(5)]
+        Message.objects.create(sender=self.user, recipient=self.third_user, message='其他会话')
+
+    def test_conversation_key(self):
+        """双方发送的私信使用相同的会话标识"""
+        self.assertEqual(self.messages[0].conversation_key, self.messages[1].conversation_key)
+
+    def test_get_conversation(self):
+        """只返回双方之间的私信"""
+        self.assertEqual(Message.objects.get_conversation(self.user, self.other_user).count(), 5)
+        self.assertEqual(Message.objects.get_conversation(self.other_user, self.user).count(), 5)
+
+    def test_get_conversation_page(self):
+        """键集分页依次返回更早的私信"""
+        first_page, has_more = Message.objects.get_conversation_page(self.user, self.other_user, limit=3)
+        self.assertTrue(has_more)
+        self.assertEqual([m.message for m in first_page], ['私信2', '私信3', '私信4'])
+        second_page, has_more = Message.objects.get_conversation_page(
+            self.user, self.other_user, before=first_page[0].uuid_id, limit=3)
+        self.assertFalse(has_more)
+        self.assertEqual([m.message for m in second_page], ['私信0', '私信1'])
+
+    def test_record_conversation(self):
+        """发送私信后更新双方的会话摘要"""
+        inbox = Conversation.objects.get_inbox(self.user)
+        self.assertEqual([c.other for c in inbox], [self.third_user, self.other_user])
+        conversation = Conversation.objects.get(owner=self.user, other=self.other_user)
+        self.assertEqual(conversation.last_message, '私信4')
+        self.assertEqual(conversation.unread_count, 3)  # user01收到了私信0、私信2、私信4
+        self.assertEqual(Conversation.objects.get(owner=self.other_user, other=self.user).unread_count, 2)
+        self.assertEqual(Conversation.objects.get(owner=self.third_user, other=self.user).unread_count, 1)
+
+    def test_mark_conversation_as_read(self):
+        """打开会话时批量标为已读"""
+        self.assertEqual(Conversation.objects.get_unread_count(self.user), 3)
+        self.assertTrue(Conversation.objects.mark_as_read(self.user, self.other_user))
+        self.assertEqual(Conversation.objects.get_unread_count(self.user), 0)
+        self.assertFalse(Message.objects.filter(recipient=self.user, unread=True).exists())
+        self.assertTrue(Message.objects.filter(recipient=self.other_user, unread=True).exists())
+        # 没有未读私信时不再写数据库
+        self.assertFalse(Conversation.objects.mark_as_read(self.user, self.other_user))
+
+    def test_to_event(self):
+        """私信事件只包含前端渲染需要的字段"""
+        event = self.messages[1].to_event()
+        self.assertEqual(event['id'], str(self.messages[1].uuid_id))
+        self.assertEqual(event['sender'], 'user01')
+        self.assertEqual(event['text'], '私信1')
+        self.assertEqual(event['picture'], '')
+        self.assertEqual(set(event), {'id', 'sender', 'sender_name', 'picture', 'text', 'created_at'})
+
+    def test_archive_conversation(self):
+        """归档的私信从私信表删除，分页读取时从归档中加载"""
+        key = self.messages[0].conversation_key
+        archived = MessageArchive.objects.archive_conversation(key, timezone.now(), chunk_size=3)
+        self.assertEqual(archived, 5)
+        self.assertFalse(Message.objects.filter(conversation_key=key).exists())
+        self.assertEqual(MessageArchive.objects.filter(conversation_key=key).count(), 2)
+        # 私信表已没有记录，从最新的归档开始读取
+        messages, cursor = Message.objects.get_conversation_history(self.user, self.other_user)
+        self.assertEqual([m.message for m in messages], ['私信3', '私信4'])
+        self.assertEqual(messages[0].sender, self.user)
+        messages, cursor = Message.objects.get_conversation_history(self.user, self.other_user, cursor=cursor)
+        self.assertEqual([m.message for m in messages], ['私信0', '私信1', '私信2'])
+        self.assertIsNone(cursor)
@@ -11,5 +11,7 @@ app_name = 'messager'
 urlpatterns = [
     path('', views.MessagesListView.as_view(), name='messages_list'),
     path('send-message/', views.send_message, name='send_message'),
-    path('<str:username>/', views.ConversationListView.as_view(), name='conversation_detail')
+    path('<str:username>/', views.ConversationListView.as_view(), name='conversation_detail'),
+    path('<str:username>/older/', views.get_older_messages, name='older_messages'),
+    path('<str:username>/mark-as-read/', views.mark_conversation_as_read, name='mark_conversation_read'),
 ]
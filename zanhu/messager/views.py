@@ -3,8 +3,9 @@
 # __author__ = '__AYC__'
 
 from asgiref.sync import async_to_sync
-from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
@@ -14,51 +15,93 @@ from django.template.loader import render_to_string
 
 from channels.layers import get_channel_layer
 
-from zanhu.messager.models import Message
+from zanhu.messager.models import Message, Conversation
+from zanhu.users.presence import presence
 from zanhu.helpers import ajax_required
 
 
 class MessagesListView(LoginRequiredMixin, ListView):
-    """最近10位私信用户列表"""
+    """私信会话列表，以及最近一次私信互动的内容"""
     model = Message
     template_name = 'messager/message_list.html'
+    page_size = 20  # 打开会话时加载最新的20条私信，更早的私信向上滚动时分页加载
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data()
-        # 获取除了登录用户之外的所有用户，按最近登录时间顺序降序排列
-        context['users_list'] = get_user_model().objects.filter(is_active=True).exclude(
-            username=self.request.user.username
-        ).order_by('-last_login')[:10]
-        # 获取最近一次私信互动的用户
-        last_conversation = Message.objects.get_most_recent_conversation(self.request.user)
-        context['active'] = last_conversation.username
+        context['conversations'] = self.conversations
+        context['active'] = self.active_user.username
+        context['cursor'] = self.cursor
+        # 还没有会话的在线用户，用于发起新的私信，只按用户名（唯一索引）查询
+        excluded = {self.request.user.username} | {c.other.username for c in self.conversations}
+        usernames = [u for u in presence.get_online_users(limit=len(excluded) + 10) if u not in excluded][:10]
+        users = get_user_model().objects.filter(username__in=usernames, is_active=True).in_bulk(
+            usernames, field_name='username')
+        context['users_list'] = [users[u] for u in usernames if u in users]  # 保持最近活跃的顺序
+        # 会话列表中在线的用户，一次查询在线状态
+        context['online'] = presence.filter_online(
+            [c.other.username for c in self.conversations]) | set(usernames)
         return context
 
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # 打开会话时批量标为已读，不在get_queryset中修改数据
+        Conversation.objects.mark_as_read(request.user, self.active_user)
+        return response
+
+    def get_active_user(self):
+        """最近一次私信互动的用户，没有私信时返回当前登录的用户"""
+        return self.conversations[0].other if self.conversations else self.request.user
+
     def get_queryset(self):
-        """最近一次私信互动的内容"""
-        active_user = Message.objects.get_most_recent_conversation(self.request.user)
-        return Message.objects.get_conversation(self.request.user, active_user)
+        """当前会话最新的一页私信"""
+        # 会话列表只查询一次摘要表，最近的会话即为默认打开的会话
+        self.conversations = list(Conversation.objects.get_inbox(self.request.user)[:10])
+        self.active_user = self.get_active_user()
+        messages, self.cursor = Message.objects.get_conversation_history(
+            self.request.user, self.active_user, limit=self.page_size)
+        return messages
 
 
 class ConversationListView(MessagesListView):
     """与指定用户的私信内容"""
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super().get_context_data()
-        context['active'] = self.kwargs['username']
-        return context
+    def get_active_user(self):
+        return get_object_or_404(get_user_model(), username=self.kwargs['username'])
 
-    def get_queryset(self):
-        active_user = get_object_or_404(get_user_model(),
-                                        username=self.kwargs['username'])
-        return Message.objects.get_conversation(self.request.user, active_user)
+
+@login_required
+@ajax_required
+@require_http_methods(['GET'])
+def get_older_messages(request, username):
+    """加载会话中更早的私信（包括已归档的私信），AJAX GET请求，使用键集分页"""
+    active_user = get_object_or_404(get_user_model(), username=username)
+    try:
+        messages, cursor = Message.objects.get_conversation_history(
+            request.user, active_user, cursor=request.GET.get('cursor'), limit=MessagesListView.page_size)
+    except (ValidationError, ValueError):
+        return HttpResponseBadRequest('无效的分页参数！')
+    html = render_to_string('messager/message_page.html', {'message_list': messages})
+    return JsonResponse({
+        'messages': html,
+        'cursor': cursor
+    })
+
+
+@login_required
+@ajax_required
+@require_http_methods(['POST'])
+def mark_conversation_as_read(request, username):
+    """会话打开期间收到新私信时标为已读，AJAX POST请求"""
+    active_user = get_object_or_404(get_user_model(), username=username)
+    Conversation.objects.mark_as_read(request.user, active_user)
+    return JsonResponse({'unread': Conversation.objects.get_unread_count(request.user)})
 
 
 @login_required
 @ajax_required
 @require_http_methods(['POST'])
 def send_message(request):
-    """发送消息，AJAX POST请求"""
+    """发送消息，AJAX POST请求（WebSocket不可用时使用）"""
     sender = request.user
     recipient_username = request.POST['to']
     recipient = get_user_model().objects.get(username=recipient_username)
@@ -69,12 +112,12 @@ def send_message(request):
             recipient=recipient,
             message=message
         )
+        event = msg.to_event()  # 只推送数据，由前端渲染
         channel_layer = get_channel_layer()
         payload = {
-            'type': 'receive',
-            'message': render_to_string('messager/single_message.html', {'message': msg}),
-            'sender': sender.username
+            'type': 'chat.message',  # 传递给consumer的chat_message方法
+            'message': event
         }
         async_to_sync(channel_layer.group_send)(recipient_username, payload)  # 将异步代码转为同步代码
-        return render(request, 'messager/single_message.html', {'message': msg})
+        return JsonResponse(event)
     return HttpResponse()
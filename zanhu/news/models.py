@@ -9,6 +9,7 @@ from django.contrib.auth import settings
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
+from zanhu.notifications.consumers import BROADCAST_GROUP
 from zanhu.notifications.views import notification_handler
 
 
@@ -40,11 +41,13 @@ class News(models.Model):
         if not self.reply:
             channel_layer = get_channel_layer()
             payload = {
-                'type': 'receive',
-                'key': 'additional_news',
-                'actor_name': self.user.username
+                'type': 'notification.message',
+                'message': {
+                    'key': 'additional_news',
+                    'actor': self.user.username
+                }
             }
-            async_to_sync(channel_layer.group_send)('notifications', payload)
+            async_to_sync(channel_layer.group_send)(BROADCAST_GROUP, payload)
 
     def switch_like(self, user):
         """点赞或取消赞"""
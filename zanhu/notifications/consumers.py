@@ -4,8 +4,18 @@
 
 import json
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from zanhu.users.presence import presence
+
+BROADCAST_GROUP = 'notifications'  # 全站广播的组，只用于新动态这类所有在线用户都要收到的事件
+
+
+def get_user_group(user_id):
+    """用户私有的通知组，定向通知只发送到接收者所在的组"""
+    return f'notifications-{user_id}'
+
 
 class NotificationsConsumer(AsyncWebsocketConsumer):
     """处理通知应用中的WebSocket请求"""
@@ -16,19 +26,24 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
             # 未登录用户拒绝连接
             await self.close()
         else:
-            await self.channel_layer.group_add('notifications', self.channel_name)  # 添加到组
+            # 同时加入广播组和自己的通知组
+            await self.channel_layer.group_add(BROADCAST_GROUP, self.channel_name)
+            await self.channel_layer.group_add(get_user_group(self.scope['user'].pk), self.channel_name)
             await self.accept()  # 接收连接
+            await sync_to_async(presence.connect)(self.scope['user'].username, self.channel_name)
 
     async def receive(self, text_data=None, bytes_data=None):
-        """将接收到的消息（从视图）返回给前端"""
-        recipient = self.scope['user'].username
-        # news动态发布时通知所有在线用户
-        if text_data.get('key') == 'additional_news':
-            await self.send(text_data=json.dumps(text_data))
-        # 只通知接收者，即recipient==动作对象的作者
-        if recipient != text_data.get('actor_name') and recipient == text_data.get('action_object'):
-            await self.send(text_data=json.dumps(text_data))
+        """前端发送的心跳，刷新在线状态"""
+        await sync_to_async(presence.heartbeat)(self.scope['user'].username, self.channel_name)
+
+    async def notification_message(self, event):
+        """将视图发送到组中的通知推送给前端，接收者已在发送时确定，无需再过滤"""
+        await self.send(text_data=json.dumps(event['message']))
 
     async def disconnect(self, code):
         """断开连接"""
-        await self.channel_layer.group_discard('notifications', self.channel_name)  # 移出组
+        if self.scope['user'].is_anonymous:
+            return
+        await self.channel_layer.group_discard(BROADCAST_GROUP, self.channel_name)  # 移出组
+        await self.channel_layer.group_discard(get_user_group(self.scope['user'].pk), self.channel_name)
+        await sync_to_async(presence.disconnect)(self.scope['user'].username, self.channel_name)
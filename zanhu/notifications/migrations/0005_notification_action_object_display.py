@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-19 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notification_unread_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='action_object_display',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='动作对象'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.7 on 2026-10-19 16:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notification_action_object_display'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='notification',
+            name='slug',
+        ),
+    ]
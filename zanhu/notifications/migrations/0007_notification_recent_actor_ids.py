@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_remove_notification_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='recent_actor_ids',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='最近的触发者'),
+        ),
+    ]
@@ -2,14 +2,18 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
+import json
 import uuid
+from collections import defaultdict
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.core import serializers
-from slugify import slugify
+
+UNREAD_COUNT_CACHE_KEY = 'notifications:unread_count:{}'  # 用户的未读通知数
 
 
 class NotificationQuerySet(models.query.QuerySet):
@@ -25,30 +29,90 @@ class NotificationQuerySet(models.query.QuerySet):
 
     def mark_all_as_read(self, recipient=None):
         """标记已读，可以传入接收者参数"""
-        qs = self.unread()
-        if recipient:
-            qs = qs.filter(recipient=recipient)
-        return qs.update(unread=False)
+        return self._update_unread(self.unread(), recipient, False)
 
     def mark_all_as_unread(self, recipient=None):
         """标记为未读，可以传入接收者参数"""
-        qs = self.read()
+        return self._update_unread(self.read(), recipient, True)
+
+    def mark_as_read(self, recipient_id, pk):
+        """按主键将接收者的一条通知标为已读，返回是否有更新"""
+        updated = self.filter(pk=pk, recipient_id=recipient_id, unread=True).update(unread=False)
+        if updated:
+            self.reset_unread_counts([recipient_id])
+        return updated
+
+    def mark_as_unread(self, recipient_id, pk):
+        """按主键将接收者的一条通知标为未读，返回是否有更新"""
+        updated = self.filter(pk=pk, recipient_id=recipient_id, unread=False).update(unread=True)
+        if updated:
+            self.reset_unread_counts([recipient_id])
+        return updated
+
+    def get_unread_count(self, recipient):
+        """用户的未读通知数，优先读取缓存，缓存不存在时查询一次数据库"""
+        key = UNREAD_COUNT_CACHE_KEY.format(recipient.pk)
+        count = cache.get(key)
+        if count is None:
+            count = self.filter(recipient=recipient, unread=True).count()
+            cache.set(key, count, settings.NOTIFICATION_UNREAD_COUNT_TIMEOUT)
+        return count
+
+    @staticmethod
+    def reset_unread_counts(recipient_ids):
+        """
+        未读通知变化后清除用户的未读数缓存，下次读取时重新统计
+        在事务提交后才清除，避免并发的读取在提交前重新统计并缓存旧值；
+        不在缓存上加减，并发重新统计时加减会使缓存与数据库不一致
+        """
+        keys = [UNREAD_COUNT_CACHE_KEY.format(pk) for pk in recipient_ids]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
+    def _update_unread(self, qs, recipient, unread):
+        """批量修改已读状态，返回更新的数量"""
         if recipient:
             qs = qs.filter(recipient=recipient)
-        return qs.update(unread=True)
+            recipient_ids = [recipient.pk]
+        else:
+            recipient_ids = list(qs.order_by().values_list('recipient_id', flat=True).distinct())
+        updated = qs.update(unread=unread)
+        if updated:
+            self.reset_unread_counts(recipient_ids)
+        return updated
 
     def get_most_recent(self, recipient=None):
         """获取最近5条消息，可以传入接收者参数"""
         qs = self.unread()
         if recipient:
             qs = qs.filter(recipient=recipient)
-        return qs[:5]
+        return qs.order_by('-created_at', '-uuid_id')[:5]
+
+    def get_unread_page(self, recipient, before=None, limit=20):
+        """
+        键集分页获取未读通知，走(recipient, unread, created_at)联合索引，按时间倒序返回
+        :param recipient: 接收者
+        :param before: 上一页最后一条通知的uuid_id，为None时返回最新的一页
+        :param limit: int 每页数量
+        :return: (通知列表, 下一页的游标，没有更多时为None)
+        """
+        qs = self.unread().filter(recipient=recipient).order_by('-created_at', '-uuid_id')
+        if before:
+            cursor = self.filter(uuid_id=before, recipient=recipient).values('created_at').first()
+            if cursor is None:
+                return [], None
+            qs = qs.filter(models.Q(created_at__lt=cursor['created_at']) |
+                           models.Q(created_at=cursor['created_at'], uuid_id__lt=before))
+        notifications = list(qs[:limit + 1])  # 多取一条，判断是否还有下一页
+        has_more = len(notifications) > limit
+        notifications = notifications[:limit]
+        return notifications, (notifications[-1].uuid_id if has_more else None)
 
     def serialize_latest_notifications(self, recipient=None):
-        """序列化最近5条通知，可以传入接收者参数"""
-        qs = self.get_most_recent(recipient=recipient)
-        notification_dic = serializers.serialize('json', qs)
-        return notification_dic
+        """序列化最近5条通知，可以传入接收者参数，只输出前端需要的字段"""
+        notifications = Notification.load_action_objects(list(self.get_most_recent(recipient=recipient)))
+        return json.dumps([notification.to_event() for notification in notifications],
+                          ensure_ascii=False, separators=(',', ':'))
 
 
 class Notification(models.Model):
@@ -67,10 +131,12 @@ class Notification(models.Model):
     uuid_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     actor = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='notify_actor',
                               on_delete=models.CASCADE, verbose_name='触发者')
+    actor_count = models.PositiveIntegerField('触发人数', default=1)  # 合并的通知中不重复的触发者数，触发者为最近的一位
+    # JSON，最多保存NOTIFICATION_RECENT_ACTORS位最近的触发者，合并通知时用于去重
+    recent_actor_ids = models.CharField('最近的触发者', max_length=255, blank=True, default='')
     recipient = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True, related_name='notifications',
                                   on_delete=models.CASCADE, verbose_name='接收者')
     unread = models.BooleanField('是否未读', default=True, db_index=True)
-    slug = models.SlugField('URL别名', max_length=80, blank=True, null=True)
     verb = models.CharField('通知类别', max_length=1, choices=NOTIFICATION_TYPE)
     created_at = models.DateTimeField('创建时间', auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField('更新时间', auto_now=True)
@@ -79,6 +145,8 @@ class Notification(models.Model):
                                      on_delete=models.CASCADE)
     object_id = models.CharField(max_length=255, blank=True, null=True)
     action_object = GenericForeignKey()
+    # 创建通知时保存动作对象的显示文本，渲染列表时不需要再查询动作对象
+    action_object_display = models.CharField('动作对象', max_length=255, blank=True, default='')
 
     objects = NotificationQuerySet.as_manager()  # 使用自定义查询结果集
 
@@ -86,27 +154,70 @@ class Notification(models.Model):
         verbose_name = '通知'
         verbose_name_plural = verbose_name
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['recipient', 'unread', 'created_at'], name='notification_unread_idx'),
+        ]
 
     def __str__(self):
-        if self.action_object:
-            return f'{self.actor} {self.get_verb_display()} {self.action_object}。'
-        return f'{self.actor} {self.get_verb_display()}。'
-
-    def save(self, force_insert=False, force_update=False, using=None,
-             update_fields=None):
-        """重写save方法，自动生成slug"""
-        if not self.slug:
-            self.slug = slugify(f'{self.recipient} {self.uuid_id} {self.verb}')
-        super().save()
+        actor = f'{self.actor}等{self.actor_count}人' if self.actor_count > 1 else f'{self.actor}'
+        action_object = self.get_action_object_display()
+        if action_object:
+            return f'{actor} {self.get_verb_display()} {action_object}。'
+        return f'{actor} {self.get_verb_display()}。'
+
+    @staticmethod
+    def make_action_object_display(action_object):
+        """动作对象的显示文本快照"""
+        return str(action_object)[:255]
+
+    def get_action_object_display(self):
+        """优先使用快照，没有快照的旧通知才读取动作对象"""
+        if self.action_object_display:
+            return self.action_object_display
+        return str(self.action_object) if self.action_object else ''
+
+    @classmethod
+    def load_action_objects(cls, notifications):
+        """
+        为没有快照的通知批量加载动作对象：按内容类型分组，每种类型只查询一次
+        :param notifications: list 通知列表
+        :return: 原通知列表
+        """
+        groups = defaultdict(list)
+        for notification in notifications:
+            if not notification.action_object_display and notification.content_type_id:
+                groups[notification.content_type_id].append(notification)
+        field = cls._meta.get_field('action_object')
+        for content_type_id, items in groups.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            to_python = model._meta.pk.to_python
+            objects = model._base_manager.in_bulk({to_python(item.object_id) for item in items})
+            for item in items:
+                field.set_cached_value(item, objects.get(to_python(item.object_id)))
+        return notifications
+
+    def to_event(self):
+        """通知的精简结构，用于轮询接口和WebSocket推送，触发者需已通过select_related加载"""
+        return {
+            'id': str(self.uuid_id),
+            'actor': self.actor.username,
+            'actor_name': self.actor.get_profile_name(),
+            'actor_count': self.actor_count,
+            'verb': self.verb,
+            'verb_display': self.get_verb_display(),
+            'object': self.get_action_object_display(),
+            'unread': self.unread,
+            'created_at': timezone.localtime(self.created_at).strftime('%Y-%m-%d %H:%M:%S')
+        }
 
     def mark_as_read(self):
-        """标记为已读"""
+        """标记为已读，只执行一条UPDATE"""
         if self.unread:
             self.unread = False
-            self.save()
+            Notification.objects.mark_as_read(self.recipient_id, self.pk)
 
     def mark_as_unread(self):
-        """标记为未读"""
+        """标记为未读，只执行一条UPDATE"""
         if not self.unread:
             self.unread = True
-            self.save()
+            Notification.objects.mark_as_unread(self.recipient_id, self.pk)
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import asyncio
+import json
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from zanhu.taskapp.celery import app
+from zanhu.notifications.consumers import get_user_group
+from zanhu.notifications.models import Notification, UNREAD_COUNT_CACHE_KEY
+
+NOTIFICATION_QUEUE_KEY = 'notifications:queue'  # 待处理的通知事件
+NOTIFICATION_PENDING_KEY = 'notifications:queue:pending'  # 已有排队中的处理任务
+NOTIFICATION_PROCESSING_KEY = 'notifications:processing'  # 正在写入的一批事件，写入提交后才删除
+NOTIFICATION_LOCK_KEY = 'notifications:lock'  # 同一时间只有一个任务处理队列
+
+# 原子地将队列头部的一批事件移到处理中列表
+CLAIM_BATCH_SCRIPT = """
+local events = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #events > 0 then
+    redis.call('RPUSH', KEYS[2], unpack(events))
+    redis.call('LTRIM', KEYS[1], #events, -1)
+end
+return events
+"""
+
+
+def enqueue_notification(event):
+    """通知事件加入队列，队列中没有排队的处理任务时才发送Celery任务"""
+    delay = settings.NOTIFICATION_FLUSH_DELAY
+    pipe = get_redis_connection('default').pipeline()
+    pipe.rpush(NOTIFICATION_QUEUE_KEY, json.dumps(event))
+    # 任务丢失时标记最多保留1分钟，之后的事件会重新发送任务
+    pipe.set(NOTIFICATION_PENDING_KEY, 1, nx=True, ex=delay + 60)
+    if pipe.execute()[-1]:
+        flush_notifications.apply_async(countdown=delay)
+
+
+def claim_notifications(batch_size):
+    """
+    取出一批待写入的事件：上次任务写入失败或中断时遗留在处理中列表的事件优先重新处理，
+    否则从队列头部移入一批。事件在写入提交后才从处理中列表删除，不会丢失
+    """
+    redis = get_redis_connection('default')
+    events = redis.lrange(NOTIFICATION_PROCESSING_KEY, 0, -1)
+    if not events:
+        events = redis.eval(CLAIM_BATCH_SCRIPT, 2, NOTIFICATION_QUEUE_KEY, NOTIFICATION_PROCESSING_KEY, batch_size)
+    return [json.loads(event) for event in events]
+
+
+async def dispatch(messages):
+    """在同一个事件循环中并发发送一批频道消息"""
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(channel_layer.group_send(group, payload) for group, payload in messages))
+
+
+def coalesce_notifications(events):
+    """
+    合并同一接收者、同一动作对象上的同类通知，时间窗口内的未读通知只更新触发者和人数，不新增记录
+    :param events: list 一批通知事件
+    :return: (每组需要推送的(事件, 通知主键), 有新增未读通知的接收者)
+    """
+    groups = OrderedDict()
+    for event in events:
+        key = (event['recipient'], event['verb'], event['content_type'], event['object_id'])
+        groups.setdefault(key, []).append(event)
+    now = timezone.now()
+    # 一次查询找出窗口内可以合并的未读通知
+    existing = {}
+    for row in Notification.objects.filter(
+            unread=True, created_at__gte=now - timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW),
+            recipient_id__in={key[0] for key in groups}, object_id__in={key[3] for key in groups}
+    ).order_by('created_at').values('pk', 'recipient_id', 'verb', 'content_type_id', 'object_id',
+                                    'actor_id', 'actor_count', 'recent_actor_ids'):
+        existing[(row['recipient_id'], row['verb'], row['content_type_id'], row['object_id'])] = row
+    notifications = []
+    pks = {}  # 每组写入或合并到的通知
+    max_recent = settings.NOTIFICATION_RECENT_ACTORS
+    for key, group in groups.items():
+        latest = group[-1]
+        # 同一用户多次触发（如赞了又取消再赞）只算一人，按最后一次触发的顺序排列
+        actor_ids = list(dict.fromkeys(event['actor'] for event in reversed(group)))[::-1]
+        if key in existing:
+            # 合并到已有的通知，移到列表顶部，只累加最近的触发者中没有的用户
+            row = existing[key]
+            recent = json.loads(row['recent_actor_ids']) if row['recent_actor_ids'] else [row['actor_id']]
+            actor_count = row['actor_count'] + len([actor_id for actor_id in actor_ids if actor_id not in recent])
+            recent = [actor_id for actor_id in recent if actor_id not in actor_ids] + actor_ids
+            Notification.objects.filter(pk=row['pk']).update(
+                actor_id=latest['actor'], actor_count=actor_count, recent_actor_ids=json.dumps(recent[-max_recent:]),
+                action_object_display=latest['action_object_display'], created_at=now, updated_at=now)
+            pks[key] = row['pk']
+            continue
+        notification = Notification(
+            actor_id=latest['actor'],
+            actor_count=len(actor_ids),
+            recent_actor_ids=json.dumps(actor_ids[-max_recent:]),
+            recipient_id=latest['recipient'],
+            verb=latest['verb'],
+            content_type_id=latest['content_type'],
+            object_id=latest['object_id'],
+            action_object_display=latest['action_object_display']
+        )
+        notifications.append(notification)
+        pks[key] = notification.pk
+    Notification.objects.bulk_create(notifications)
+    created = {notification.recipient_id for notification in notifications}
+    # 每组只推送一次，给自己的动作对象操作时不推送
+    pushes = []
+    for key, group in groups.items():
+        others = [event for event in group if event['actor'] != event['recipient']]
+        if others:
+            pushes.append((others[-1], pks[key]))
+    return pushes, created
+
+
+def make_push_message(event, notification):
+    """推送给前端的内容：与轮询接口相同的通知结构，加上前端区分事件类型的key和动态的ID"""
+    message = notification.to_event()
+    message['key'] = event['key']
+    message['id_value'] = event['id_value']
+    return message
+
+
+@app.task(ignore_result=True)
+def flush_notifications():
+    """批量合并、写入队列中的通知，再批量推送给接收者"""
+    redis = get_redis_connection('default')
+    lock = redis.lock(NOTIFICATION_LOCK_KEY, timeout=5 * 60)
+    if not lock.acquire(blocking=False):
+        # 其他任务正在处理队列，稍后再执行，避免同一批事件被写入两次
+        flush_notifications.apply_async(countdown=settings.NOTIFICATION_FLUSH_DELAY)
+        return
+    try:
+        # 先清除排队标记，之后入队的事件会触发新的任务，不会遗留在队列中
+        redis.delete(NOTIFICATION_PENDING_KEY)
+        batch_size = settings.NOTIFICATION_BATCH_SIZE
+        while True:
+            events = claim_notifications(batch_size)
+            if not events:
+                break
+            with transaction.atomic():
+                pushes, created = coalesce_notifications(events)
+            redis.delete(NOTIFICATION_PROCESSING_KEY)  # 写入已提交
+            # 合并到未读通知不改变未读数，只需清除有新增通知的用户的缓存
+            Notification.objects.reset_unread_counts(created)
+            # 写入后一次查询加载需要推送的通知，推送合并后的人数和最近的触发者
+            notifications = Notification.objects.select_related('actor').in_bulk([pk for _, pk in pushes])
+            Notification.load_action_objects(list(notifications.values()))
+            async_to_sync(dispatch)([(get_user_group(event['recipient']), {
+                'type': 'notification.message',
+                'message': make_push_message(event, notifications[pk])
+            }) for event, pk in pushes if pk in notifications])
+    finally:
+        lock.release()
+
+
+def delete_in_chunks(qs, chunk_size):
+    """按主键分块删除，避免长时间锁表和过大的事务"""
+    deleted = 0
+    while True:
+        pks = list(qs.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        deleted += Notification.objects.filter(pk__in=pks).delete()[0]
+
+
+@app.task(ignore_result=True)
+def purge_notifications():
+    """由Celery beat周期执行，删除过期的已读通知，并限制每个用户保留的通知数量"""
+    chunk_size = settings.NOTIFICATION_PURGE_CHUNK_SIZE
+    cutoff = timezone.now() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    delete_in_chunks(Notification.objects.filter(unread=False, created_at__lt=cutoff), chunk_size)
+    # 超过上限的用户，删除最早的通知（包括未读的），上限为0时不限制
+    max_count = settings.NOTIFICATION_MAX_PER_USER
+    if max_count <= 0:
+        return
+    recipient_ids = Notification.objects.order_by().values('recipient_id').annotate(
+        count=Count('pk')).filter(count__gt=max_count).values_list('recipient_id', flat=True)
+    for recipient_id in recipient_ids:
+        qs = Notification.objects.filter(recipient_id=recipient_id)
+        oldest_kept = qs.order_by('-created_at').values_list('created_at', flat=True)[max_count - 1]
+        delete_in_chunks(qs.filter(created_at__lt=oldest_kept), chunk_size)
+        cache.delete(UNREAD_COUNT_CACHE_KEY.format(recipient_id))
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from test_plus.test import TestCase
+
+from zanhu.news.models import News
+from zanhu.notifications.consumers import NotificationsConsumer, BROADCAST_GROUP, get_user_group
+from zanhu.users.presence import presence
+
+
+class FakeChannelLayer:
+    """记录加入和离开的组，不需要运行Redis"""
+
+    def __init__(self):
+        self.groups = set()
+
+    async def group_add(self, group, channel):
+        self.groups.add((group, channel))
+
+    async def group_discard(self, group, channel):
+        self.groups.discard((group, channel))
+
+
+class TestNotificationsConsumer(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.frames = []
+        self.addCleanup(presence.clear)
+
+    def make_consumer(self, user):
+        consumer = NotificationsConsumer({'type': 'websocket', 'user': user})
+        consumer.channel_name = 'channel-1'
+        consumer.channel_layer = FakeChannelLayer()
+
+        async def base_send(message):
+            self.frames.append(message)
+
+        consumer.base_send = base_send
+        return consumer
+
+    def test_connect(self):
+        """登录用户同时加入广播组和自己的通知组"""
+        consumer = self.make_consumer(self.user)
+        async_to_sync(consumer.connect)()
+        self.assertEqual(consumer.channel_layer.groups, {
+            (BROADCAST_GROUP, 'channel-1'), (get_user_group(self.user.pk), 'channel-1')})
+        self.assertEqual(self.frames[0]['type'], 'websocket.accept')
+        self.assertIn(self.user.username, presence.get_online_users())
+
+        async_to_sync(consumer.disconnect)(1000)
+        self.assertEqual(consumer.channel_layer.groups, set())
+        self.assertNotIn(self.user.username, presence.get_online_users())
+
+    def test_anonymous(self):
+        """未登录用户不加入任何组"""
+        consumer = self.make_consumer(AnonymousUser())
+        async_to_sync(consumer.connect)()
+        self.assertEqual(consumer.channel_layer.groups, set())
+        self.assertEqual(self.frames[-1]['type'], 'websocket.close')
+
+    def test_user_groups(self):
+        """每个用户的通知组不同"""
+        self.assertNotEqual(get_user_group(self.user.pk), get_user_group(self.make_user('user02').pk))
+
+    def test_notification_message(self):
+        """组中的通知原样推送给前端"""
+        consumer = self.make_consumer(self.user)
+        message = {'key': 'notification', 'id': '1'}
+        async_to_sync(consumer.notification_message)({'type': 'notification.message', 'message': message})
+        self.assertEqual(json.loads(self.frames[-1]['text']), message)
+
+    def test_broadcast(self):
+        """新动态发送到广播组"""
+        with mock.patch('zanhu.news.models.get_channel_layer') as get_channel_layer:
+            sent = []
+
+            async def group_send(group, payload):
+                sent.append((group, payload))
+
+            get_channel_layer.return_value.group_send = group_send
+            News.objects.create(user=self.user, content='新动态')
+        self.assertEqual(sent[0][0], BROADCAST_GROUP)
+        self.assertEqual(sent[0][1]['message'], {'key': 'additional_news', 'actor': self.user.username})
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from test_plus.test import TestCase
+
+from zanhu.notifications.models import Notification, UNREAD_COUNT_CACHE_KEY
+
+
+class NotificationTestCase(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.other_user = self.make_user('user02')
+        self.notifications = [Notification.objects.create(
+            actor=self.other_user, recipient=self.user, verb='L', action_object=self.user
+        ) for _ in range(3)]
+        # TestCase中事务不会提交，让on_commit回调立即执行以便检查缓存
+        patcher = mock.patch.object(transaction, 'on_commit', side_effect=lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cache.clear)
+
+
+class TestUnreadCount(NotificationTestCase):
+
+    def test_cached(self):
+        """未读数缓存后不再查询数据库"""
+        self.assertEqual(Notification.objects.get_unread_count(self.user), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(Notification.objects.get_unread_count(self.user), 3)
+
+    def test_mark_as_read(self):
+        """标为已读或未读后清除缓存，重新统计"""
+        Notification.objects.get_unread_count(self.user)
+        self.notifications[0].mark_as_read()
+        self.assertIsNone(cache.get(UNREAD_COUNT_CACHE_KEY.format(self.user.pk)))
+        self.assertEqual(Notification.objects.get_unread_count(self.user), 2)
+        self.notifications[0].mark_as_unread()
+        self.assertEqual(Notification.objects.get_unread_count(self.user), 3)
+
+    def test_mark_all_as_read(self):
+        Notification.objects.get_unread_count(self.user)
+        Notification.objects.get_unread_count(self.other_user)
+        Notification.objects.mark_all_as_read()
+        self.assertEqual(Notification.objects.get_unread_count(self.user), 0)
+        self.assertEqual(Notification.objects.get_unread_count(self.other_user), 0)
+        Notification.objects.mark_all_as_unread(recipient=self.user)
+        self.assertEqual(Notification.objects.get_unread_count(self.user), 3)
+
+    def test_no_change(self):
+        """没有更新时不清除缓存"""
+        Notification.objects.get_unread_count(self.user)
+        Notification.objects.mark_as_read(self.other_user.pk, self.notifications[0].pk)
+        self.assertEqual(cache.get(UNREAD_COUNT_CACHE_KEY.format(self.user.pk)), 3)
+
+    def test_reset_after_commit(self):
+        """在事务提交后才清除缓存"""
+        Notification.objects.get_unread_count(self.user)
+        with mock.patch.object(transaction, 'on_commit') as on_commit:
+            Notification.objects.reset_unread_counts([self.user.pk])
+        self.assertEqual(cache.get(UNREAD_COUNT_CACHE_KEY.format(self.user.pk)), 3)
+        on_commit.call_args[0][0]()
+        self.assertIsNone(cache.get(UNREAD_COUNT_CACHE_KEY.format(self.user.pk)))
+
+
+class TestUnreadPage(NotificationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.notifications += [Notification.objects.create(
+            actor=self.other_user, recipient=self.user, verb='C', action_object=self.user
+        ) for _ in range(2)]
+        # 部分通知的创建时间相同，按uuid_id区分先后
+        Notification.objects.filter(pk__in=[n.pk for n in self.notifications[1:4]]).update(
+            created_at=self.notifications[1].created_at)
+        self.expected = list(Notification.objects.filter(recipient=self.user).order_by('-created_at', '-uuid_id'))
+
+    def test_pages(self):
+        """逐页读取时不重复、不遗漏"""
+        pages, cursor = [], None
+        while True:
+            notifications, cursor = Notification.objects.get_unread_page(self.user, before=cursor, limit=2)
+            pages.append(notifications)
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([n for page in pages for n in page], self.expected)
+
+    def test_only_unread(self):
+        self.expected[0].mark_as_read()
+        notifications, cursor = Notification.objects.get_unread_page(self.user, limit=10)
+        self.assertEqual(notifications, self.expected[1:])
+        self.assertIsNone(cursor)
+
+    def test_invalid_cursor(self):
+        """其他用户的通知不能作为游标"""
+        other = Notification.objects.create(
+            actor=self.user, recipient=self.other_user, verb='L', action_object=self.other_user)
+        self.assertEqual(Notification.objects.get_unread_page(self.user, before=other.pk), ([], None))
+
+
+class TestToEvent(NotificationTestCase):
+
+    def test_to_event(self):
+        notification = self.notifications[0]
+        notification.actor_count = 2
+        event = notification.to_event()
+        self.assertEqual(set(event), {'id', 'actor', 'actor_name', 'actor_count', 'verb', 'verb_display',
+                                      'object', 'unread', 'created_at'})
+        self.assertEqual(event['id'], str(notification.pk))
+        self.assertEqual(event['actor'], 'user02')
+        self.assertEqual(event['actor_count'], 2)
+        self.assertEqual(event['verb_display'], '赞了')
+        self.assertEqual(event['object'], str(self.user))
+        self.assertTrue(event['unread'])
+
+    def test_serialize_latest(self):
+        """轮询接口输出与推送相同的结构"""
+        data = json.loads(Notification.objects.serialize_latest_notifications(recipient=self.user))
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[0], Notification.objects.get(pk=data[0]['id']).to_event())
@@ -0,0 +1,285 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import json
+from collections import defaultdict
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.test import override_settings
+from django.utils import timezone
+from test_plus.test import TestCase
+
+from zanhu.notifications import tasks
+from zanhu.notifications.consumers import get_user_group
+from zanhu.notifications.models import Notification
+
+
+class FakePipeline:
+    """按顺序执行命令，execute时返回所有结果"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.results = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+
+        def call(*args, **kwargs):
+            self.results.append(method(*args, **kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+
+class FakeLock:
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def acquire(self, blocking=True):
+        if self.redis.locked:
+            return False
+        self.redis.locked = True
+        return True
+
+    def release(self):
+        self.redis.locked = False
+
+
+class FakeRedis:
+    """只实现通知队列用到的命令，不需要运行Redis"""
+
+    def __init__(self):
+        self.lists = defaultdict(list)
+        self.values = {}
+        self.locked = False
+
+    def rpush(self, key, *values):
+        self.lists[key].extend(values)
+        return len(self.lists[key])
+
+    def lrange(self, key, start, end):
+        values = self.lists[key]
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def eval(self, script, numkeys, queue_key, processing_key, batch_size):
+        """与CLAIM_BATCH_SCRIPT相同：将队列头部的一批事件移到处理中列表"""
+        events = self.lists[queue_key][:batch_size]
+        self.lists[processing_key].extend(events)
+        del self.lists[queue_key][:len(events)]
+        return events
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.lists.pop(key, None)
+            self.values.pop(key, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def lock(self, name, timeout=None):
+        return FakeLock(self)
+
+
+class NotificationTaskTestCase(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.other_user = self.make_user('user02')
+        self.third_user = self.make_user('user03')
+        self.redis = FakeRedis()
+        self.dispatched = []
+
+        async def dispatch(messages):
+            self.dispatched.extend(messages)
+
+        self.patch(mock.patch.object(tasks, 'get_redis_connection', return_value=self.redis))
+        self.patch(mock.patch.object(tasks, 'dispatch', dispatch))
+        self.scheduled = self.patch(mock.patch.object(tasks.flush_notifications, 'apply_async'))
+
+    def patch(self, patcher):
+        mocked = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mocked
+
+    def make_event(self, actor, recipient, action_object, **kwargs):
+        """与notification_handler生成的事件结构相同"""
+        return dict({
+            'actor': actor.pk,
+            'recipient': recipient.pk,
+            'verb': 'L',
+            'content_type': ContentType.objects.get_for_model(action_object).pk,
+            'object_id': str(action_object.pk),
+            'action_object_display': Notification.make_action_object_display(action_object),
+            'key': 'notification',
+            'id_value': None
+        }, **kwargs)
+
+
+class TestFlushNotifications(NotificationTaskTestCase):
+
+    def test_enqueue(self):
+        """队列中已有排队的任务时不再发送任务"""
+        tasks.enqueue_notification(self.make_event(self.other_user, self.user, self.user))
+        tasks.enqueue_notification(self.make_event(self.third_user, self.user, self.user))
+        self.assertEqual(len(self.redis.lists[tasks.NOTIFICATION_QUEUE_KEY]), 2)
+        self.assertEqual(self.scheduled.call_count, 1)
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=2)
+    def test_flush(self):
+        """分批写入队列中的所有事件，写入后清空处理中列表，并推送到接收者的通知组"""
+        tasks.enqueue_notification(self.make_event(self.other_user, self.user, self.user))
+        tasks.enqueue_notification(self.make_event(self.third_user, self.user, self.user))
+        tasks.enqueue_notification(self.make_event(self.user, self.other_user, self.other_user))
+        tasks.flush_notifications()
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.other_user).count(), 1)
+        self.assertEqual(self.redis.lists[tasks.NOTIFICATION_QUEUE_KEY], [])
+        self.assertEqual(self.redis.lists[tasks.NOTIFICATION_PROCESSING_KEY], [])
+        self.assertNotIn(tasks.NOTIFICATION_PENDING_KEY, self.redis.values)
+        self.assertFalse(self.redis.locked)
+        groups = [group for group, _ in self.dispatched]
+        self.assertEqual(groups, [get_user_group(self.user.pk), get_user_group(self.other_user.pk)])
+        self.assertEqual(self.dispatched[-1][1]['type'], 'notification.message')
+
+    def test_flush_failure(self):
+        """写入失败时事件保留在处理中列表，下次任务优先重新写入"""
+        tasks.enqueue_notification(self.make_event(self.other_user, self.user, self.user))
+        with mock.patch.object(tasks, 'coalesce_notifications', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                tasks.flush_notifications()
+        self.assertEqual(len(self.redis.lists[tasks.NOTIFICATION_PROCESSING_KEY]), 1)
+        self.assertFalse(self.redis.locked)
+        self.assertFalse(Notification.objects.exists())
+
+        tasks.flush_notifications()
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 1)
+        self.assertEqual(self.redis.lists[tasks.NOTIFICATION_PROCESSING_KEY], [])
+
+    def test_flush_locked(self):
+        """其他任务正在处理队列时稍后重试，不重复写入"""
+        tasks.enqueue_notification(self.make_event(self.other_user, self.user, self.user))
+        self.scheduled.reset_mock()
+        self.redis.locked = True
+        tasks.flush_notifications()
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(len(self.redis.lists[tasks.NOTIFICATION_QUEUE_KEY]), 1)
+        self.scheduled.assert_called_once_with(countdown=mock.ANY)
+
+
+class TestCoalesceNotifications(NotificationTaskTestCase):
+
+    def test_coalesce_window(self):
+        """时间窗口内同一对象上的同类未读通知合并为一条，超出窗口后新增通知"""
+        tasks.coalesce_notifications([self.make_event(self.other_user, self.user, self.user)])
+        tasks.coalesce_notifications([self.make_event(self.third_user, self.user, self.user)])
+        notification = Notification.objects.get(recipient=self.user)
+        self.assertEqual(notification.actor, self.third_user)
+        self.assertEqual(notification.actor_count, 2)
+
+        Notification.objects.update(created_at=timezone.now() - timedelta(
+            seconds=settings.NOTIFICATION_COALESCE_WINDOW + 1))
+        tasks.coalesce_notifications([self.make_event(self.other_user, self.user, self.user)])
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 2)
+
+    def test_coalesce_read(self):
+        """已读的通知不再合并"""
+        tasks.coalesce_notifications([self.make_event(self.other_user, self.user, self.user)])
+        Notification.objects.mark_all_as_read(recipient=self.user)
+        _, created = tasks.coalesce_notifications([self.make_event(self.third_user, self.user, self.user)])
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 2)
+        self.assertEqual(created, {self.user.pk})
+
+    def test_merge_actors(self):
+        """同一用户重复触发只算一人，最近的触发者为最后一位"""
+        pushes, created = tasks.coalesce_notifications([
+            self.make_event(self.other_user, self.user, self.user),
+            self.make_event(self.third_user, self.user, self.user),
+            self.make_event(self.other_user, self.user, self.user),
+        ])
+        notification = Notification.objects.get(recipient=self.user)
+        self.assertEqual(notification.actor, self.other_user)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(json.loads(notification.recent_actor_ids), [self.third_user.pk, self.other_user.pk])
+        self.assertEqual(created, {self.user.pk})
+        self.assertEqual(len(pushes), 1)
+
+        # 合并到已有通知时不再计入已有的触发者，也不改变未读数
+        _, created = tasks.coalesce_notifications([self.make_event(self.third_user, self.user, self.user)])
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor, self.third_user)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(created, set())
+
+    @override_settings(NOTIFICATION_RECENT_ACTORS=2)
+    def test_recent_actors_bounded(self):
+        """只保存最近的几位触发者"""
+        fourth_user = self.make_user('user04')
+        for actor in [self.other_user, self.third_user, fourth_user]:
+            tasks.coalesce_notifications([self.make_event(actor, self.user, self.user)])
+        notification = Notification.objects.get(recipient=self.user)
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(json.loads(notification.recent_actor_ids), [self.third_user.pk, fourth_user.pk])
+
+    def test_no_push_to_self(self):
+        """操作自己的对象时写入通知但不推送"""
+        pushes, _ = tasks.coalesce_notifications([self.make_event(self.user, self.user, self.user)])
+        self.assertEqual(pushes, [])
+        self.assertTrue(Notification.objects.filter(recipient=self.user).exists())
+
+
+class TestPurgeNotifications(NotificationTaskTestCase):
+
+    def setUp(self):
+        super().setUp()
+        old = timezone.now() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS + 1)
+        self.old_read = Notification.objects.create(
+            actor=self.other_user, recipient=self.user, verb='L', action_object=self.user, unread=False)
+        self.old_unread = Notification.objects.create(
+            actor=self.other_user, recipient=self.user, verb='C', action_object=self.user)
+        Notification.objects.update(created_at=old)
+        self.recent = [Notification.objects.create(
+            actor=self.third_user, recipient=self.user, verb='F', action_object=self.user, unread=False
+        ) for _ in range(2)]
+
+    def test_purge_expired(self):
+        """只删除过期的已读通知"""
+        tasks.purge_notifications()
+        self.assertEqual(set(Notification.objects.all()), {self.old_unread, *self.recent})
+
+    @override_settings(NOTIFICATION_MAX_PER_USER=2, NOTIFICATION_PURGE_CHUNK_SIZE=1)
+    def test_purge_max_per_user(self):
+        """超过上限时删除最早的通知，包括未读的"""
+        tasks.purge_notifications()
+        self.assertEqual(set(Notification.objects.all()), set(self.recent))
+
+    @override_settings(NOTIFICATION_MAX_PER_USER=0)
+    def test_purge_unlimited(self):
+        """上限为0时不限制每个用户的通知数量"""
+        tasks.purge_notifications()
+        self.assertEqual(set(Notification.objects.all()), {self.old_unread, *self.recent})
+
+
+class TestMakePushMessage(NotificationTaskTestCase):
+
+    def test_make_push_message(self):
+        """推送的内容为通知的事件结构，加上前端区分事件类型的key和动态的ID"""
+        event = self.make_event(self.other_user, self.user, self.user, key='social_update', id_value='1')
+        pushes, _ = tasks.coalesce_notifications([event])
+        notification = Notification.objects.select_related('actor').get(pk=pushes[0][1])
+        message = tasks.make_push_message(pushes[0][0], notification)
+        self.assertEqual(message, dict(notification.to_event(), key='social_update', id_value='1'))
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import uuid
+
+from test_plus.test import TestCase
+
+from zanhu.notifications.models import Notification
+
+
+class BaseNotificationViewTest(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.other_user = self.make_user('user02')
+        self.notifications = [Notification.objects.create(
+            actor=self.other_user, recipient=self.user, verb='L', action_object=self.user
+        ) for _ in range(3)]
+
+
+class TestNotificationListView(BaseNotificationViewTest):
+
+    def test_pages(self):
+        """通过?before=翻页"""
+        with self.login(username='user01'):
+            first = self.get('notifications:unread')
+        self.response_200(first)
+        self.assertEqual(len(first.context['notification_list']), 3)
+        self.assertIsNone(first.context['cursor'])
+
+        expected = list(Notification.objects.filter(recipient=self.user).order_by('-created_at', '-uuid_id'))
+        with self.login(username='user01'):
+            response = self.get('notifications:unread', data={'before': expected[0].pk})
+        self.assertEqual(list(response.context['notification_list']), expected[1:])
+
+    def test_invalid_cursor(self):
+        with self.login(username='user01'):
+            self.get('notifications:unread', data={'before': 'not-a-uuid'})
+            self.response_404()
+            response = self.get('notifications:unread', data={'before': uuid.uuid4()})
+        self.assertEqual(list(response.context['notification_list']), [])
+
+
+class TestMarkAsRead(BaseNotificationViewTest):
+
+    def test_mark_own(self):
+        """标记自己的通知为已读"""
+        notification = self.notifications[0]
+        with self.login(username='user01'):
+            response = self.get('notifications:mark_as_read', pk=notification.pk)
+        self.response_302(response)
+        notification.refresh_from_db()
+        self.assertFalse(notification.unread)
+        self.assertEqual(Notification.objects.filter(recipient=self.user, unread=True).count(), 2)
+
+    def test_mark_read_again(self):
+        """已读的通知再次标记时正常返回"""
+        notification = self.notifications[0]
+        notification.mark_as_read()
+        with self.login(username='user01'):
+            self.get('notifications:mark_as_read', pk=notification.pk)
+        self.response_302()
+
+    def test_mark_others(self):
+        """不能标记其他用户的通知"""
+        notification = self.notifications[0]
+        with self.login(username='user02'):
+            self.get('notifications:mark_as_read', pk=notification.pk)
+        self.response_404()
+        notification.refresh_from_db()
+        self.assertTrue(notification.unread)
+
+    def test_mark_all_own(self):
+        """只标记自己的所有通知"""
+        other = Notification.objects.create(
+            actor=self.user, recipient=self.other_user, verb='L', action_object=self.other_user)
+        with self.login(username='user01'):
+            self.get('notifications:mark_all_read')
+        self.response_302()
+        self.assertFalse(Notification.objects.filter(recipient=self.user, unread=True).exists())
+        other.refresh_from_db()
+        self.assertTrue(other.unread)
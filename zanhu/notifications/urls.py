@@ -11,6 +11,8 @@ app_name = 'notifications'
 urlpatterns = [
     path('', views.NotificationListView.as_view(), name='unread'),
     path('latest-notifications/', views.get_latest_notifications, name='latest_notifications'),
-    path('mark-as-read/<str:slug>/', views.mark_as_read, name='mark_as_read'),
+    path('latest-notifications/data/', views.get_latest_notifications_data, name='latest_notifications_data'),
+    path('unread-count/', views.get_unread_count, name='unread_count'),
+    path('mark-as-read/<uuid:pk>/', views.mark_as_read, name='mark_as_read'),
     path('mark-all-read/', views.mark_all_as_read, name='mark_all_read'),
 ]
@@ -5,12 +5,15 @@
 from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 
 from zanhu.notifications.models import Notification
+from zanhu.notifications.tasks import enqueue_notification
 
 
 class NotificationListView(LoginRequiredMixin, ListView):
@@ -19,23 +22,49 @@ class NotificationListView(LoginRequiredMixin, ListView):
     context_object_name = 'notification_list'
     template_name = 'notifications/notification_list.html'
 
+    page_size = 20
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data()
+        context['cursor'] = self.cursor
+        return context
+
     def get_queryset(self):
-        """自定义查询范围"""
-        return self.request.user.notifications.unread()
+        """未读通知的一页，通过?before=<上一页最后一条通知的ID>翻页"""
+        try:
+            notifications, self.cursor = Notification.objects.get_unread_page(
+                self.request.user, before=self.request.GET.get('before'), limit=self.page_size)
+        except ValidationError:
+            raise Http404
+        return Notification.load_action_objects(notifications)
 
 
 @login_required
 def get_latest_notifications(request):
     """最近的未读通知"""
-    notifications = request.user.notifications.get_most_recent()
+    notifications = list(Notification.objects.get_most_recent(recipient=request.user))
+    Notification.load_action_objects(notifications)
     return render(request, 'notifications/most_recent.html',
                   {'notifications': notifications})
 
 
+@login_required
+def get_latest_notifications_data(request):
+    """最近的未读通知，返回精简的JSON数据，供前端自行渲染"""
+    return HttpResponse(Notification.objects.serialize_latest_notifications(recipient=request.user),
+                        content_type='application/json')
+
+
+@login_required
+def get_unread_count(request):
+    """未读通知数，导航栏轮询时只读取缓存"""
+    return JsonResponse({'count': Notification.objects.get_unread_count(request.user)})
+
+
 @login_required
 def mark_all_as_read(request):
     """标记所有通知为已读"""
-    request.user.notifications.mark_all_as_read()
+    Notification.objects.mark_all_as_read(recipient=request.user)
     redirect_url = request.GET.get('next')
     messages.add_message(request, messages.SUCCESS,
                          f'{request.user.username}的所有通知已标为已读！')
@@ -45,13 +74,13 @@ def mark_all_as_read(request):
 
 
 @login_required
-def mark_as_read(request, slug):
-    """标记单条消息为已读"""
-    notification = get_object_or_404(Notification, slug=slug)
-    notification.mark_as_read()
+def mark_as_read(request, pk):
+    """标记单条消息为已读，只能标记自己的通知"""
+    if not Notification.objects.mark_as_read(request.user.pk, pk):
+        # 没有更新时区分通知已读和通知不存在（或不属于当前用户）
+        get_object_or_404(Notification, pk=pk, recipient=request.user)
     redirect_url = request.GET.get('next')
-    messages.add_message(request, messages.SUCCESS,
-                         f'通知{notification}已标为已读！')
+    messages.add_message(request, messages.SUCCESS, '通知已标为已读！')
     if redirect_url:
         return redirect(redirect_url)
     return redirect('notifications:unread')
@@ -59,30 +88,22 @@ def mark_as_read(request, slug):
 
 def notification_handler(actor, recipient, verb, action_object, **kwargs):
     """
-    通知处理器
+    通知处理器，事务提交后将通知事件加入队列，由Celery任务批量写入和推送，不占用请求的响应时间
     :param actor: request.user对象
-    :param recipient: User Instance 接收者实例，可以是一个或多个对象
+    :param recipient: User Instance 接收者实例
     :param verb: str 通知类别
     :param action_object: Instance 动作对象的实例
-    :param kwargs: key，id_value等
+    :param kwargs: key，id_value等，与通知一起推送给前端
     :return: None
     """
-    key = kwargs.get('key', 'notification')
-    id_value = kwargs.get('id_value', None)
-    # 记录通知内容
-    Notification.objects.create(
-        actor=actor,
-        recipient=recipient,
-        verb=verb,
-        action_object=action_object
-    )
-    # 将消息传递给consumer.py中的的receive方法
-    channel_layer = get_channel_layer()  # 获取频道层
-    payload = {
-        'type': 'receive',  # 固定的，传递给consumer的receive方法
-        'key': key,
-        'actor_name': actor.username,
-        'action_object': action_object.user.username,
-        'id_value': id_value
+    event = {
+        'actor': actor.pk,
+        'recipient': recipient.pk,
+        'verb': verb,
+        'content_type': ContentType.objects.get_for_model(action_object).pk,
+        'object_id': str(action_object.pk),
+        'action_object_display': Notification.make_action_object_display(action_object),
+        'key': kwargs.get('key', 'notification'),
+        'id_value': kwargs.get('id_value', None)
     }
-    async_to_sync(channel_layer.group_send)('notifications', payload)  # 将消息传递给consumer，并将异步代码转为同步
+    transaction.on_commit(lambda: enqueue_notification(event))
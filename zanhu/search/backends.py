@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+"""
+进程内的搜索引擎，用于测试和单机部署，不需要运行Elasticsearch
+
+倒排索引保存在内存中，中文按二元分词（相邻两个字为一个词，同时索引单字，用于匹配只有一个汉字的查询），英文和数字按单词切分，使用BM25计算相关度。
+配置PATH时索引持久化到文件，读取时通过mmap映射，文件被其他进程（如Celery worker）更新后自动重新加载：
+
+    HAYSTACK_CONNECTIONS = {
+        'default': {
+            'ENGINE': 'zanhu.search.backends.LocalEngine',
+            'PATH': '/var/lib/zanhu/search.idx',  # 不配置时只保存在内存中
+        }
+    }
+
+只支持全文检索、EdgeNgramField字段的前缀匹配（用于autocomplete）、按模型类过滤、field:value形式的narrow和字段分面，
+不支持NOT和其他字段级别的查询。
+"""
+
+import fcntl
+import math
+import mmap
+import os
+import pickle
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery
+from haystack.constants import DJANGO_CT, DJANGO_ID, ID
+from haystack.exceptions import SkipDocument
+from haystack.inputs import PythonData
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+
+TOKEN_RE = re.compile(r'[\u4e00-\u9fff]+|[a-z0-9]+')
+OPERATOR_RE = re.compile(r'\b(AND|OR|NOT)\b')
+FIELD_RE = re.compile(r'^([a-z_]\w*):(.+)$')  # 查询字符串中字段级别的词，值中的冒号已被转义
+PREFIX_MAX_LENGTH = 15  # 与Elasticsearch前缀索引的最大长度一致
+
+
+def tokenize(text, unigrams=False):
+    """
+    分词：连续的汉字切分为相邻两字的二元词，单个汉字保留为一个词，英文和数字按单词切分
+    :param unigrams: bool 同时输出每个汉字，建立索引时使用，只有一个汉字的查询词才能匹配到较长的汉字串
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(str(text).lower()):
+        if '\u4e00' <= run[0] <= '\u9fff' and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if unigrams:
+                tokens.extend(run)
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def prefixes(text):
+    """前缀分词：每个连续的汉字串或英文单词的所有前缀，用于EdgeNgramField字段的前缀匹配"""
+    return {run[:i] for run in TOKEN_RE.findall(str(text).lower())
+            for i in range(1, min(len(run), PREFIX_MAX_LENGTH) + 1)}
+
+
+class LocalSearchBackend(BaseSearchBackend):
+    """纯Python实现的倒排索引"""
+    k1 = 1.2  # BM25参数，词频饱和度
+    b = 0.75  # BM25参数，文档长度归一化程度
+
+    def __init__(self, connection_alias, **connection_options):
+        super().__init__(connection_alias, **connection_options)
+        self.path = connection_options.get('PATH')
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.documents = {}  # 标识 -> 存储的字段
+        self.doc_terms = {}  # 标识 -> {词: 词频}，删除文档时使用
+        self.lengths = {}  # 标识 -> 文档词数
+        self.postings = defaultdict(dict)  # 词 -> {标识: 词频}
+        self.prefixes = defaultdict(set)  # (字段, 前缀) -> {标识}，EdgeNgramField字段的前缀索引
+        self.doc_prefixes = {}  # 标识 -> {(字段, 前缀)}，删除文档时使用
+
+    def _load(self):
+        """索引文件被修改过时通过mmap重新加载"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    (self.documents, self.doc_terms, self.lengths, postings,
+                     prefixes, self.doc_prefixes) = pickle.loads(data)
+                self.postings = defaultdict(dict, postings)
+                self.prefixes = defaultdict(set, prefixes)
+        self._mtime = mtime
+
+    def _save(self):
+        """先写临时文件再替换，读取的进程不会读到写了一半的文件"""
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.documents, self.doc_terms, self.lengths, dict(self.postings),
+                         dict(self.prefixes), self.doc_prefixes), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    @contextmanager
+    def _writing(self):
+        """
+        修改索引：加进程锁和线程锁，先加载其他进程写入的内容，修改后保存
+        索引通过文件在进程间共享，commit=False时也立即保存，否则会被其他进程的写入覆盖
+        """
+        with self._lock:
+            lock_file = open(f'{self.path}.lock', 'w') if self.path else None
+            try:
+                if lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._load()
+                yield
+                self._save()
+            finally:
+                if lock_file:
+                    lock_file.close()
+
+    def _remove(self, identifier):
+        self.documents.pop(identifier, None)
+        self.lengths.pop(identifier, None)
+        for term in self.doc_terms.pop(identifier, {}):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(identifier, None)
+                if not postings:
+                    del self.postings[term]
+        for key in self.doc_prefixes.pop(identifier, ()):
+            identifiers = self.prefixes.get(key)
+            if identifiers is not None:
+                identifiers.discard(identifier)
+                if not identifiers:
+                    del self.prefixes[key]
+
+    def update(self, index, iterable, commit=True):
+        content_field = index.get_content_field()
+        prefix_fields = [field.index_fieldname for field in index.fields.values() if field.field_type == 'edge_ngram']
+        with self._writing():
+            for obj in iterable:
+                try:
+                    doc = index.full_prepare(obj)
+                except SkipDocument:
+                    continue
+                identifier = doc[ID]
+                self._remove(identifier)
+                terms = Counter(tokenize(doc.get(content_field) or '', unigrams=True))
+                # 全文字段只用于建立倒排索引，不保存原文
+                self.documents[identifier] = {key: value for key, value in doc.items() if key != content_field}
+                self.doc_terms[identifier] = dict(terms)
+                self.lengths[identifier] = sum(terms.values())
+                for term, tf in terms.items():
+                    self.postings[term][identifier] = tf
+                keys = {(name, prefix) for name in prefix_fields for prefix in prefixes(doc.get(name) or '')}
+                self.doc_prefixes[identifier] = keys
+                for key in keys:
+                    self.prefixes[key].add(identifier)
+
+    def remove(self, obj_or_string, commit=True):
+        with self._writing():
+            self._remove(get_identifier(obj_or_string))
+
+    def clear(self, models=None, commit=True):
+        with self._writing():
+            if models is None:
+                self._reset()
+                return
+            cts = {get_model_ct(model) for model in models}
+            for identifier in [i for i, doc in self.documents.items() if doc[DJANGO_CT] in cts]:
+                self._remove(identifier)
+
+    def _score(self, terms, candidates):
+        """BM25相关度，文档必须包含所有查询词"""
+        total = len(self.documents)
+        avg_length = sum(self.lengths.values()) / total if total else 0
+        scores = {}
+        for identifier in candidates:
+            length = self.lengths[identifier]
+            score = 0.0
+            for term in terms:
+                postings = self.postings[term]
+                tf = postings[identifier]
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                norm = 1 - self.b + self.b * length / avg_length if avg_length else 1
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+            scores[identifier] = score
+        return scores
+
+    def _match(self, query_string):
+        """返回{标识: 得分}，'*'匹配所有文档，field:value形式的词匹配该字段的前缀"""
+        if query_string.strip() == '*':
+            return dict.fromkeys(self.documents, 0.0)
+        words, prefix_keys = [], []
+        for word in OPERATOR_RE.sub(' ', query_string).split():
+            match = FIELD_RE.match(word)
+            if match:
+                field, value = match.groups()
+                prefix_keys.extend((field, run[:PREFIX_MAX_LENGTH]) for run in TOKEN_RE.findall(value.lower()))
+            else:
+                words.append(word)
+        terms = list(dict.fromkeys(tokenize(' '.join(words))))
+        if not terms and not prefix_keys:
+            return {}
+        if any(term not in self.postings for term in terms):
+            return {}
+        candidates = None
+        for key in prefix_keys:
+            matched = self.prefixes.get(key, set())
+            candidates = set(matched) if candidates is None else candidates & matched
+        if not terms:
+            # 只有前缀匹配时不计算相关度，按标识排序保证结果稳定
+            return dict.fromkeys(sorted(candidates), 0.0)
+        # 从文档数最少的词开始求交集
+        terms.sort(key=lambda term: len(self.postings[term]))
+        if candidates is None:
+            candidates = set(self.postings[terms[0]])
+        for term in terms:
+            candidates &= self.postings[term].keys()
+        return self._score(terms, candidates)
+
+    def search(self, query_string, **kwargs):
+        if not query_string or not query_string.strip():
+            return {'results': [], 'hits': 0}
+        with self._lock:
+            self._load()
+            scores = self._match(query_string)
+            models = kwargs.get('models')
+            if models:
+                cts = {get_model_ct(model) for model in models}
+                scores = {i: s for i, s in scores.items() if self.documents[i][DJANGO_CT] in cts}
+            for narrow in kwargs.get('narrow_queries') or ():
+                field, _, value = narrow.partition(':')
+                value = value.strip('()"')
+                scores = {i: s for i, s in scores.items() if str(self.documents[i].get(field)) == value}
+            facets = {'fields': {}, 'dates': {}, 'queries': {}}
+            for field in kwargs.get('facets') or ():
+                counts = Counter(self.documents[i].get(field) for i in scores)
+                facets['fields'][field] = counts.most_common()
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            ranked = ranked[kwargs.get('start_offset') or 0:kwargs.get('end_offset')]
+            documents = [(self.documents[i], score) for i, score in ranked]
+        result_class = kwargs.get('result_class') or SearchResult
+        results = []
+        for doc, score in documents:
+            app_label, model_name = doc[DJANGO_CT].split('.')
+            stored = {key: value for key, value in doc.items() if key not in (ID, DJANGO_CT, DJANGO_ID)}
+            results.append(result_class(app_label, model_name, doc[DJANGO_ID], score, **stored))
+        return {'results': results, 'hits': len(scores), 'facets': facets, 'spelling_suggestion': None}
+
+
+class LocalSearchQuery(BaseSearchQuery):
+    """将查询条件拼接为查询字符串：全文检索的值直接拼接，其他字段的每个词拼接为field:value"""
+
+    def build_query(self):
+        if not self.query_filter:
+            return '*'
+        return self._build_sub_query(self.query_filter)
+
+    def _build_sub_query(self, search_node):
+        terms = []
+        for child in search_node.children:
+            if hasattr(child, 'children'):
+                terms.append(self._build_sub_query(child))
+            else:
+                field, _ = search_node.split_expression(child[0])
+                value = child[1]
+                if not hasattr(value, 'input_type_name'):
+                    value = PythonData(value)
+                value = str(value.prepare(self))
+                if field == 'content':
+                    terms.append(value)
+                else:
+                    terms.extend(f'{field}:{word}' for word in value.split())
+        return ' '.join(terms)
+
+
+class LocalEngine(BaseEngine):
+    backend = LocalSearchBackend
+    query = LocalSearchQuery
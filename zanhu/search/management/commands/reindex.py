@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import multiprocessing
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections as db_connections
+from django.utils import timezone
+from haystack import connections
+from haystack.query import SearchQuerySet
+
+from zanhu.search.models import IndexState
+
+REINDEX_PROGRESS_KEY = 'search:reindex:{}:{}'  # 每个索引已完成的最大主键
+REINDEX_STARTED_KEY = 'search:reindex:{}:{}:started_at'  # 每个索引开始重建的时间，中断后继续时沿用
+
+
+def get_index(using, label):
+    """根据app_label.model_name获取模型类的索引"""
+    return connections[using].get_unified_index().get_index(apps.get_model(label))
+
+
+def index_chunk(args):
+    """在子进程中渲染一块对象的文档，并通过一次批量请求写入搜索引擎"""
+    using, label, pks = args
+    index = get_index(using, label)
+    connections[using].get_backend().update(index, index.build_queryset(using=using).filter(pk__in=pks), commit=False)
+    return label, pks[-1], len(pks)
+
+
+class Command(BaseCommand):
+    help = '按主键分块、多进程并行重建搜索索引，中断后可以使用--resume继续'
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', nargs='*', help='要重建的模型类，如articles.article，默认为所有索引')
+        parser.add_argument('--using', default='default', help='haystack连接名')
+        parser.add_argument('--chunk-size', type=int, default=500, help='每块对象数，即每次批量请求的文档数')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='并行的进程数')
+        parser.add_argument('--resume', action='store_true', help='从上次中断的位置继续')
+        parser.add_argument('--remove', action='store_true', help='删除索引中数据库已不存在的对象')
+
+    def handle(self, *args, **options):
+        using = options['using']
+        unified_index = connections[using].get_unified_index()
+        labels = options['labels'] or [model._meta.label_lower for model in unified_index.get_indexed_models()]
+        # 子进程会复制父进程的数据库连接，创建进程池前先关闭
+        db_connections.close_all()
+        with multiprocessing.Pool(options['workers']) as pool:
+            for label in labels:
+                self.reindex(pool, using, label, options['chunk_size'], options['resume'], options['remove'])
+
+    def iter_chunks(self, using, label, chunk_size, start):
+        """按主键键集分页读取需要索引的对象主键，不一次加载整张表"""
+        qs = get_index(using, label).index_queryset(using=using).order_by('pk')
+        last = start
+        while True:
+            chunk = qs.filter(pk__gt=last) if last is not None else qs
+            pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            yield using, label, pks
+            last = pks[-1]
+
+    def remove_stale(self, using, label, chunk_size):
+        """删除索引中数据库已不存在（或不再符合索引条件）的对象，返回删除的数量"""
+        index = get_index(using, label)
+        backend = connections[using].get_backend()
+        results = SearchQuerySet(using=using).models(index.get_model())
+        stale = []
+        for start in range(0, results.count(), chunk_size):
+            pks = [str(result.pk) for result in results[start:start + chunk_size]]
+            # 每块只查询这一块中仍需要索引的对象，不一次加载整张表的主键
+            existing = {str(pk) for pk in index.index_queryset(using=using).filter(
+                pk__in=pks).values_list('pk', flat=True)}
+            stale.extend(f'{label}.{pk}' for pk in pks if pk not in existing)
+        for identifier in stale:
+            backend.remove(identifier, commit=False)
+        return len(stale)
+
+    def reindex(self, pool, using, label, chunk_size, resume, remove):
+        progress_key = REINDEX_PROGRESS_KEY.format(using, label)
+        started_key = REINDEX_STARTED_KEY.format(using, label)
+        start = cache.get(progress_key) if resume else None
+        started_at = (cache.get(started_key) if resume else None) or timezone.now()
+        cache.set(started_key, started_at, None)
+        total = 0
+        # imap按提交顺序返回结果，记录的进度之前的块都已完成
+        for _, last_pk, count in pool.imap(index_chunk, self.iter_chunks(using, label, chunk_size, start)):
+            total += count
+            cache.set(progress_key, last_pk, None)
+            self.stdout.write(f'{label}: 已索引{total}个对象')
+        if remove:
+            self.stdout.write(f'{label}: 删除了{self.remove_stale(using, label, chunk_size)}个已不存在的对象')
+        # 分块写入时没有提交，全部完成后提交一次（Elasticsearch刷新索引）
+        connections[using].get_backend().update(get_index(using, label), [], commit=True)
+        if using == 'default':
+            # 增量更新只处理默认连接，重建开始之后的修改由增量更新补上
+            IndexState.objects.update_or_create(index_name=label, defaults={'watermark': started_at})
+        cache.delete_many([progress_key, started_key])
+        self.stdout.write(self.style.SUCCESS(f'{label}: 重建完成，共{total}个对象'))
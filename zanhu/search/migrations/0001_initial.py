@@ -0,0 +1,44 @@
+# Generated by Django 2.1.7 on 2026-10-19 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index_name', models.CharField(max_length=100, unique=True, verbose_name='索引')),
+                ('watermark', models.DateTimeField(blank=True, null=True, verbose_name='水位线')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '索引状态',
+                'verbose_name_plural': '索引状态',
+            },
+        ),
+        migrations.CreateModel(
+            name='IndexTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index_name', models.CharField(max_length=100, verbose_name='索引')),
+                ('object_pk', models.CharField(max_length=255, verbose_name='对象主键')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='删除时间')),
+            ],
+            options={
+                'verbose_name': '索引删除记录',
+                'verbose_name_plural': '索引删除记录',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='indextombstone',
+            index=models.Index(fields=['index_name', 'deleted_at'], name='search_tombstone_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from django.db import models
+
+
+class IndexState(models.Model):
+    """每个索引增量更新的水位线，只索引水位线之后修改过的数据"""
+    index_name = models.CharField('索引', max_length=100, unique=True)  # app_label.model_name
+    watermark = models.DateTimeField('水位线', blank=True, null=True)  # 上次成功更新开始的时间
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        verbose_name = '索引状态'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.index_name
+
+
+class IndexTombstone(models.Model):
+    """已删除对象的记录，增量更新时据此删除索引中的文档"""
+    index_name = models.CharField('索引', max_length=100)
+    object_pk = models.CharField('对象主键', max_length=255)
+    deleted_at = models.DateTimeField('删除时间', auto_now_add=True)
+
+    class Meta:
+        verbose_name = '索引删除记录'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['index_name', 'deleted_at'], name='search_tombstone_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.index_name}.{self.object_pk}'
@@ -2,8 +2,7 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
-import datetime
-
+from django.utils.text import Truncator
 from haystack import indexes
 
 from zanhu.news.models import News
@@ -16,13 +15,32 @@ from taggit.models import Tag
 class ArticleIndex(indexes.SearchIndex, indexes.Indexable):
     """对Article模型类中部分字段建立索引"""
     text = indexes.CharField(document=True, use_template=True, template_name='search/articles_text.txt')
+    # 标题的前缀索引，用于搜索框的自动补全
+    autocomplete = indexes.EdgeNgramField(model_attr='title')
+    # 只存储不索引的字段，搜索结果页直接使用，不需要查询数据库
+    title = indexes.CharField(model_attr='title', indexed=False)
+    slug = indexes.CharField(model_attr='slug', indexed=False)
+    summary = indexes.CharField(indexed=False)
+    image_url = indexes.CharField(indexed=False, null=True)
 
     def get_model(self):
         return Article
 
+    def get_updated_field(self):
+        """增量更新时根据此字段判断是否修改过"""
+        return 'updated_at'
+
     def index_queryset(self, using=None):
         """当Article模型类中索引有更新时调用"""
-        return self.get_model().objects.filter(status='P', updated_at__lte=datetime.datetime.now())
+        return self.get_model().objects.filter(status='P')
+
+    def prepare_summary(self, obj):
+        return Truncator(obj.content).chars(100)
+
+    def prepare_image_url(self, obj):
+        if not obj.image:
+            return None
+        return obj.image_urls.get('card') or obj.image.url
 
 
 class NewsIndex(indexes.SearchIndex, indexes.Indexable):
@@ -32,9 +50,13 @@ class NewsIndex(indexes.SearchIndex, indexes.Indexable):
     def get_model(self):
         return News
 
+    def get_updated_field(self):
+        """增量更新时根据此字段判断是否修改过"""
+        return 'updated_at'
+
     def index_queryset(self, using=None):
         """当News模型类中索引有更新时调用"""
-        return self.get_model().objects.filter(reply=False, updated_at__lte=datetime.datetime.now())
+        return self.get_model().objects.filter(reply=False)
 
 
 class QuestionIndex(indexes.SearchIndex, indexes.Indexable):
@@ -44,30 +66,60 @@ class QuestionIndex(indexes.SearchIndex, indexes.Indexable):
     def get_model(self):
         return Question
 
+    def get_updated_field(self):
+        """增量更新时根据此字段判断是否修改过"""
+        return 'updated_at'
+
     def index_queryset(self, using=None):
         """当Question模型类中索引有更新时调用"""
-        return self.get_model().objects.filter(updated_at__lte=datetime.datetime.now())
+        return self.get_model().objects.all()
 
 
 class UserIndex(indexes.SearchIndex, indexes.Indexable):
     """对User模型类中部分字段建立索引"""
     text = indexes.CharField(document=True, use_template=True, template_name='search/users_text.txt')
+    autocomplete = indexes.EdgeNgramField()
+    username = indexes.CharField(model_attr='username', indexed=False)
+    profile_name = indexes.CharField(model_attr='get_profile_name', indexed=False)
+    email = indexes.CharField(model_attr='email', indexed=False, null=True)
+    job_title = indexes.CharField(model_attr='job_title', indexed=False, null=True)
+    location = indexes.CharField(model_attr='location', indexed=False, null=True)
+    picture_url = indexes.CharField(indexed=False, null=True)
 
     def get_model(self):
         return get_user_model()
 
+    def get_updated_field(self):
+        """增量更新时根据此字段判断是否修改过"""
+        return 'updated_at'
+
     def index_queryset(self, using=None):
         """当User模型类中索引有更新时调用"""
-        return self.get_model().objects.filter(updated_at__lte=datetime.datetime.now())
+        return self.get_model().objects.all()
+
+    def prepare_autocomplete(self, obj):
+        """用户名和昵称都可以补全"""
+        return ' '.join(filter(None, [obj.username, obj.nickname]))
+
+    def prepare_picture_url(self, obj):
+        if not obj.picture:
+            return None
+        return obj.picture_urls.get('x75') or obj.picture.url
 
 
 class TagsIndex(indexes.SearchIndex, indexes.Indexable):
     """对Tags模型类中部分字段建立索引"""
     text = indexes.CharField(document=True, use_template=True, template_name='search/tags_text.txt')
+    autocomplete = indexes.EdgeNgramField(model_attr='name')
+    name = indexes.CharField(model_attr='name', indexed=False)
 
     def get_model(self):
         return Tag
 
+    def get_updated_field(self):
+        """标签没有更新时间，增量更新时全部更新（标签数量很少）"""
+        return None
+
     def index_queryset(self, using=None):
         """当Tags模型类中索引有更新时调用"""
         return self.get_model().objects.all()
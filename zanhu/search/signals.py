@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from django.db import models, transaction
+from haystack import signals
+from haystack.utils import get_identifier
+
+
+class QueuedSignalProcessor(signals.BaseSignalProcessor):
+    """
+    队列信号处理器，模型类中数据增加、更新、删除时只记录对象标识，
+    事务提交后由Celery任务批量去重更新索引，请求中不再等待搜索引擎
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def is_indexed(self, sender):
+        """只处理建立了索引的模型类"""
+        return sender in self.connections['default'].get_unified_index().get_indexed_models()
+
+    def handle_save(self, sender, instance, **kwargs):
+        if self.is_indexed(sender):
+            self.enqueue(get_identifier(instance), deleted=False)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if self.is_indexed(sender):
+            # 同时记录删除，队列中的任务丢失时由增量更新删除索引
+            from zanhu.search.models import IndexTombstone
+            IndexTombstone.objects.create(index_name=sender._meta.label_lower, object_pk=str(instance.pk))
+            self.enqueue(get_identifier(instance), deleted=True)
+
+    @staticmethod
+    def enqueue(identifier, deleted):
+        from zanhu.search.tasks import enqueue_search_update
+        transaction.on_commit(lambda: enqueue_search_update(identifier, deleted=deleted))
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+from django_redis import get_redis_connection
+from haystack import connections
+from haystack.exceptions import NotHandled
+
+from zanhu.taskapp.celery import app
+from zanhu.search.models import IndexState, IndexTombstone
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DIRTY_KEY = 'search:dirty'  # 待更新索引的对象标识，集合自动去重
+SEARCH_DELETED_KEY = 'search:deleted'  # 待删除索引的对象标识
+SEARCH_PENDING_KEY = 'search:pending'  # 已有排队中的索引任务
+
+
+def enqueue_search_update(*identifiers, deleted=False):
+    """
+    记录需要更新或删除索引的对象，没有排队的任务时发送Celery任务
+    :param identifiers: str haystack对象标识，app_label.model_name.pk
+    :param deleted: bool 对象是否已删除
+    """
+    delay = settings.SEARCH_UPDATE_DELAY
+    pipe = get_redis_connection('default').pipeline()
+    if deleted:
+        pipe.srem(SEARCH_DIRTY_KEY, *identifiers)
+        pipe.sadd(SEARCH_DELETED_KEY, *identifiers)
+    else:
+        pipe.sadd(SEARCH_DIRTY_KEY, *identifiers)
+    pipe.set(SEARCH_PENDING_KEY, 1, nx=True, ex=delay + 60)
+    if pipe.execute()[-1]:
+        update_search_index.apply_async(countdown=delay)
+
+
+def get_task_backend():
+    """任务使用的搜索后端，出错时抛出异常而不是只记录日志，失败的更新才能放回队列重试"""
+    connection = connections['default']
+    return connection.backend(connection.using, **dict(connection.options, SILENTLY_FAIL=False))
+
+
+def group_identifiers(identifiers):
+    """对象标识按模型类分组"""
+    groups = defaultdict(list)
+    for identifier in identifiers:
+        app_label, model_name, pk = identifier.decode().split('.', 2)
+        groups[(app_label, model_name)].append(pk)
+    return groups
+
+
+@app.task(ignore_result=True)
+def update_search_index():
+    """批量更新队列中对象的索引，同一对象多次修改只更新一次"""
+    redis = get_redis_connection('default')
+    redis.delete(SEARCH_PENDING_KEY)
+    backend = get_task_backend()
+    unified_index = connections['default'].get_unified_index()
+    batch_size = settings.SEARCH_UPDATE_BATCH_SIZE
+    while True:
+        dirty = redis.spop(SEARCH_DIRTY_KEY, batch_size)
+        deleted = redis.spop(SEARCH_DELETED_KEY, batch_size)
+        if not dirty and not deleted:
+            break
+        try:
+            for (app_label, model_name), pks in group_identifiers(dirty).items():
+                try:
+                    model = apps.get_model(app_label, model_name)
+                except LookupError:
+                    # 模型已被删除，放回集合也无法处理，记录后丢弃，避免一直重试
+                    logger.warning('丢弃未知模型%s.%s的索引更新：%s', app_label, model_name, ', '.join(pks))
+                    continue
+                try:
+                    index = unified_index.get_index(model)
+                except NotHandled:
+                    continue
+                update_objects(backend, index, pks)
+            for (app_label, model_name), pks in group_identifiers(deleted).items():
+                for pk in pks:
+                    backend.remove(f'{app_label}.{model_name}.{pk}')
+        except Exception:
+            # 搜索引擎出错时把这一批对象放回集合，稍后由新的任务重试，不丢失更新
+            delay = settings.SEARCH_RETRY_DELAY
+            pipe = redis.pipeline()
+            if dirty:
+                pipe.sadd(SEARCH_DIRTY_KEY, *dirty)
+            if deleted:
+                pipe.sadd(SEARCH_DELETED_KEY, *deleted)
+            pipe.set(SEARCH_PENDING_KEY, 1, nx=True, ex=delay + 60)
+            if pipe.execute()[-1]:
+                update_search_index.apply_async(countdown=delay)
+            raise
+
+
+def update_objects(backend, index, pks):
+    """更新一批对象的索引，不再符合索引条件的对象（如文章改为草稿）从索引中删除"""
+    qs = index.index_queryset().filter(pk__in=pks)
+    backend.update(index, qs)
+    indexed = {str(pk) for pk in qs.values_list('pk', flat=True)}
+    label = index.get_model()._meta.label_lower
+    for pk in {str(pk) for pk in pks} - indexed:
+        backend.remove(f'{label}.{pk}')
+
+
+def catch_up_index(backend, index, batch_size):
+    """
+    增量更新一个索引：只处理水位线之后修改或删除的对象，成功后前移水位线
+    还没有水位线的索引只记录水位线，不在周期任务中全量扫描，全量索引由reindex命令重建并记录水位线
+    没有更新时间字段的索引（如标签）每次全部更新
+    """
+    model = index.get_model()
+    label = model._meta.label_lower
+    state, _ = IndexState.objects.get_or_create(index_name=label)
+    started_at = timezone.now()
+    updated_field = index.get_updated_field()
+    if updated_field and not state.watermark:
+        state.watermark = started_at
+        state.save()
+        return
+    qs = model._default_manager.order_by('pk')
+    since = None
+    if updated_field:
+        # 回退一段时间，覆盖上次运行时尚未提交的事务
+        since = state.watermark - timedelta(seconds=settings.SEARCH_WATERMARK_OVERLAP)
+        qs = qs.filter(**{f'{updated_field}__gte': since})
+    last = None
+    while True:
+        chunk = qs.filter(pk__gt=last) if last is not None else qs
+        pks = list(chunk.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        update_objects(backend, index, pks)
+        last = pks[-1]
+    tombstones = IndexTombstone.objects.filter(index_name=label)
+    if since:
+        tombstones = tombstones.filter(deleted_at__gte=since)
+    for object_pk in tombstones.values_list('object_pk', flat=True).distinct().iterator():
+        backend.remove(f'{label}.{object_pk}')
+    state.watermark = started_at
+    state.save()
+
+
+@app.task(ignore_result=True)
+def catch_up_search_index():
+    """由Celery beat周期执行，按水位线增量更新所有索引，补上队列中丢失的更新"""
+    backend = get_task_backend()  # 出错时抛出异常，不前移水位线
+    batch_size = settings.SEARCH_UPDATE_BATCH_SIZE
+    for index in connections['default'].get_unified_index().get_indexes().values():
+        catch_up_index(backend, index, batch_size)
+    # 所有索引都已处理过的删除记录不再需要
+    oldest = IndexState.objects.aggregate(oldest=Min('watermark'))['oldest']
+    if oldest:
+        IndexTombstone.objects.filter(
+            deleted_at__lt=oldest - timedelta(seconds=settings.SEARCH_WATERMARK_OVERLAP)).delete()
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import os
+import tempfile
+
+from haystack import connections
+from haystack.query import SearchQuerySet
+from test_plus.test import TestCase
+
+from zanhu.articles.models import Article
+from zanhu.qa.models import Question
+from zanhu.search.backends import LocalSearchBackend, tokenize
+
+
+class TestLocalSearchBackend(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.article = Article.objects.create(
+            user=self.user, title='搜索引擎入门', content='倒排索引和相关度', status='P')
+        self.other = Article.objects.create(
+            user=self.user, title='Django教程', content='搜索功能的实现', status='P')
+        self.question = Question.objects.create(
+            user=self.user, title='如何实现搜索引擎', content='需要倒排索引吗')
+        self.backend = connections['default'].get_backend()
+        self.backend.clear()
+        unified_index = connections['default'].get_unified_index()
+        for model in (Article, Question):
+            index = unified_index.get_index(model)
+            self.backend.update(index, index.index_queryset())
+
+    def tearDown(self):
+        self.backend.clear()
+
+    def test_tokenize(self):
+        """中文二元分词，英文按单词切分"""
+        self.assertEqual(tokenize('Django搜索引擎'), ['django', '搜索', '索引', '引擎'])
+        self.assertEqual(tokenize('搜索', unigrams=True), ['搜索', '搜', '索'])
+
+    def test_single_character(self):
+        """只有一个汉字的查询匹配包含该字的文档"""
+        results = SearchQuerySet().auto_query('擎')
+        self.assertEqual({r.pk for r in results}, {str(self.article.pk), str(self.question.pk)})
+        self.assertEqual(SearchQuerySet().auto_query('倒').models(Article).count(), 1)
+
+    def test_search(self):
+        """必须包含所有查询词，并按相关度排序"""
+        results = SearchQuerySet().auto_query('搜索引擎')
+        self.assertEqual({r.pk for r in results}, {str(self.article.pk), str(self.question.pk)})
+        self.assertEqual(SearchQuerySet().auto_query('倒排索引').models(Article).count(), 1)
+
+    def test_autocomplete(self):
+        """EdgeNgramField字段按前缀匹配，不匹配全文字段"""
+        results = SearchQuerySet().autocomplete(autocomplete='搜索')
+        self.assertEqual([r.pk for r in results], [str(self.article.pk)])
+        self.assertEqual([r.pk for r in SearchQuerySet().autocomplete(autocomplete='dj')], [str(self.other.pk)])
+        self.assertEqual(SearchQuerySet().autocomplete(autocomplete='倒排').count(), 0)
+
+    def test_remove(self):
+        self.backend.remove(self.article)
+        self.assertEqual(SearchQuerySet().auto_query('倒排索引').count(), 1)
+
+    def test_persistence(self):
+        """索引持久化到文件，其他实例可以加载"""
+        with tempfile.TemporaryDirectory() as path:
+            path = os.path.join(path, 'search.idx')
+            backend = LocalSearchBackend('default', PATH=path)
+            index = connections['default'].get_unified_index().get_index(Article)
+            backend.update(index, [self.article])
+            reloaded = LocalSearchBackend('default', PATH=path)
+            self.assertEqual(reloaded.search('搜索引擎')['hits'], 1)
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from haystack import connections
+from test_plus.test import TestCase
+
+from zanhu.articles.models import Article
+from zanhu.search.management.commands import reindex
+from zanhu.search.models import IndexState
+
+
+class FakePool:
+    """在当前进程中按顺序执行，进程内的搜索引擎才能看到子进程写入的文档"""
+
+    def __init__(self, processes=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @staticmethod
+    def imap(func, iterable):
+        return map(func, iterable)
+
+
+class TestReindexCommand(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.articles = [Article.objects.create(
+            user=self.user, title=f'文章{i}', content='内容', status='P') for i in range(3)]
+        self.draft = Article.objects.create(user=self.user, title='草稿', content='内容', status='D')
+        self.backend = connections['default'].get_backend()
+        self.backend.clear()
+        self.addCleanup(self.backend.clear)
+        self.addCleanup(cache.clear)
+        for patcher in (mock.patch.object(reindex.multiprocessing, 'Pool', FakePool),
+                        mock.patch.object(reindex.db_connections, 'close_all')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reindex(self, *args):
+        call_command('reindex', 'articles.article', '--chunk-size=2', *args, stdout=StringIO())
+
+    def indexed(self):
+        return {identifier for identifier in self.backend.documents if identifier.startswith('articles.article.')}
+
+    def test_reindex(self):
+        """只索引符合条件的对象，并记录重建开始的时间作为增量更新的水位线"""
+        started_at = timezone.now()
+        self.reindex()
+        self.assertEqual(self.indexed(), {f'articles.article.{article.pk}' for article in self.articles})
+        state = IndexState.objects.get(index_name='articles.article')
+        self.assertTrue(started_at <= state.watermark <= timezone.now())
+        self.assertIsNone(cache.get(reindex.REINDEX_PROGRESS_KEY.format('default', 'articles.article')))
+
+    def test_resume(self):
+        """中断后继续时跳过已完成的对象，沿用第一次开始的时间"""
+        started_at = timezone.now() - timedelta(hours=1)
+        cache.set(reindex.REINDEX_PROGRESS_KEY.format('default', 'articles.article'), self.articles[1].pk, None)
+        cache.set(reindex.REINDEX_STARTED_KEY.format('default', 'articles.article'), started_at, None)
+        self.reindex('--resume')
+        self.assertEqual(self.indexed(), {f'articles.article.{self.articles[2].pk}'})
+        self.assertEqual(IndexState.objects.get(index_name='articles.article').watermark, started_at)
+
+    def test_remove_stale(self):
+        """分块比较，删除索引中已不存在或不再符合索引条件的对象"""
+        index = connections['default'].get_unified_index().get_index(Article)
+        self.backend.update(index, Article.objects.all())
+        deleted = f'articles.article.{self.articles[0].pk}'
+        Article.objects.filter(pk=self.articles[0].pk).delete()
+        self.reindex('--remove')
+        self.assertEqual(self.indexed(), {f'articles.article.{article.pk}' for article in self.articles[1:]})
+        self.assertNotIn(deleted, self.backend.documents)
+
+    def test_keep_stale(self):
+        """不指定--remove时不删除"""
+        index = connections['default'].get_unified_index().get_index(Article)
+        self.backend.update(index, Article.objects.all())
+        self.reindex()
+        self.assertIn(f'articles.article.{self.draft.pk}', self.backend.documents)
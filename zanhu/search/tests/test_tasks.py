@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from collections import defaultdict
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from haystack import connections
+from test_plus.test import TestCase
+
+from zanhu.articles.models import Article
+from zanhu.search import tasks
+from zanhu.search.models import IndexState, IndexTombstone
+
+
+class FakePipeline:
+    """按顺序执行命令，execute时返回所有结果"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.results = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+
+        def call(*args, **kwargs):
+            self.results.append(method(*args, **kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+
+class FakeRedis:
+    """只实现索引队列用到的命令，不需要运行Redis"""
+
+    def __init__(self):
+        self.sets = defaultdict(set)
+        self.values = {}
+
+    def sadd(self, key, *members):
+        self.sets[key].update(m.encode() if isinstance(m, str) else m for m in members)
+
+    def srem(self, key, *members):
+        self.sets[key].difference_update(m.encode() if isinstance(m, str) else m for m in members)
+
+    def spop(self, key, count):
+        return [self.sets[key].pop() for _ in range(min(count, len(self.sets[key])))]
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.sets.pop(key, None)
+            self.values.pop(key, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class SearchTaskTestCase(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.article = Article.objects.create(user=self.user, title='搜索引擎入门', content='倒排索引', status='P')
+        self.draft = Article.objects.create(user=self.user, title='草稿', content='还没有发表', status='D')
+        self.backend = connections['default'].get_backend()
+        self.backend.clear()
+        self.addCleanup(self.backend.clear)
+        self.redis = FakeRedis()
+        self.patch(mock.patch.object(tasks, 'get_redis_connection', return_value=self.redis))
+        self.patch(mock.patch.object(tasks, 'get_task_backend', return_value=self.backend))
+        self.scheduled = self.patch(mock.patch.object(tasks.update_search_index, 'apply_async'))
+
+    def patch(self, patcher):
+        mocked = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mocked
+
+    @staticmethod
+    def identifier(obj):
+        return f'{obj._meta.label_lower}.{obj.pk}'
+
+
+class TestQueuedSignalProcessor(SearchTaskTestCase):
+
+    def test_enqueue_on_commit(self):
+        """保存和删除对象时，事务提交后记录对象标识，删除时同时记录删除"""
+        with mock.patch.object(transaction, 'on_commit') as on_commit, \
+                mock.patch.object(tasks, 'enqueue_search_update') as enqueue:
+            self.article.save()
+            enqueue.assert_not_called()
+            on_commit.call_args[0][0]()
+            enqueue.assert_called_once_with(self.identifier(self.article), deleted=False)
+
+            identifier = self.identifier(self.article)
+            pk = str(self.article.pk)
+            self.article.delete()
+            on_commit.call_args[0][0]()
+            enqueue.assert_called_with(identifier, deleted=True)
+        self.assertTrue(IndexTombstone.objects.filter(index_name='articles.article', object_pk=pk).exists())
+
+
+class TestUpdateSearchIndex(SearchTaskTestCase):
+
+    def test_enqueue(self):
+        """队列中已有排队的任务时不再发送任务，删除的对象不再更新"""
+        tasks.enqueue_search_update(self.identifier(self.article), self.identifier(self.draft))
+        tasks.enqueue_search_update(self.identifier(self.draft), deleted=True)
+        self.assertEqual(self.redis.sets[tasks.SEARCH_DIRTY_KEY], {self.identifier(self.article).encode()})
+        self.assertEqual(self.redis.sets[tasks.SEARCH_DELETED_KEY], {self.identifier(self.draft).encode()})
+        self.assertEqual(self.scheduled.call_count, 1)
+
+    def test_flush(self):
+        """批量更新索引，不再符合索引条件的对象从索引中删除"""
+        self.backend.update(connections['default'].get_unified_index().get_index(Article),
+                            Article.objects.all())
+        tasks.enqueue_search_update(self.identifier(self.article), self.identifier(self.draft))
+        with self.settings(SEARCH_UPDATE_BATCH_SIZE=1):
+            tasks.update_search_index()
+        self.assertIn(self.identifier(self.article), self.backend.documents)
+        self.assertNotIn(self.identifier(self.draft), self.backend.documents)
+        self.assertEqual(self.redis.sets[tasks.SEARCH_DIRTY_KEY], set())
+
+    def test_flush_deleted(self):
+        self.backend.update(connections['default'].get_unified_index().get_index(Article),
+                            Article.objects.all())
+        tasks.enqueue_search_update(self.identifier(self.article), deleted=True)
+        tasks.update_search_index()
+        self.assertNotIn(self.identifier(self.article), self.backend.documents)
+
+    def test_retry(self):
+        """搜索引擎出错时放回集合并稍后重试"""
+        tasks.enqueue_search_update(self.identifier(self.article))
+        tasks.enqueue_search_update(self.identifier(self.draft), deleted=True)
+        self.scheduled.reset_mock()
+        with mock.patch.object(self.backend, 'update', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                tasks.update_search_index()
+        self.assertEqual(self.redis.sets[tasks.SEARCH_DIRTY_KEY], {self.identifier(self.article).encode()})
+        self.assertEqual(self.redis.sets[tasks.SEARCH_DELETED_KEY], {self.identifier(self.draft).encode()})
+        self.scheduled.assert_called_once_with(countdown=settings.SEARCH_RETRY_DELAY)
+
+        tasks.update_search_index()
+        self.assertIn(self.identifier(self.article), self.backend.documents)
+
+    def test_unknown_model(self):
+        """无法解析模型的对象记录后丢弃，不放回集合"""
+        tasks.enqueue_search_update('removed.model.1', self.identifier(self.article))
+        with self.assertLogs('zanhu.search.tasks', 'WARNING'):
+            tasks.update_search_index()
+        self.assertIn(self.identifier(self.article), self.backend.documents)
+        self.assertEqual(self.redis.sets[tasks.SEARCH_DIRTY_KEY], set())
+
+
+class TestCatchUpIndex(SearchTaskTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.index = connections['default'].get_unified_index().get_index(Article)
+        self.old = Article.objects.create(user=self.user, title='很久以前的文章', content='内容', status='P')
+        Article.objects.filter(pk=self.old.pk).update(updated_at=timezone.now() - timedelta(days=1))
+
+    def set_watermark(self, watermark):
+        IndexState.objects.update_or_create(index_name='articles.article', defaults={'watermark': watermark})
+
+    def test_no_watermark(self):
+        """还没有水位线时只记录水位线，不全量扫描"""
+        started_at = timezone.now()
+        tasks.catch_up_index(self.backend, self.index, 100)
+        self.assertEqual(self.backend.documents, {})
+        self.assertGreaterEqual(IndexState.objects.get(index_name='articles.article').watermark, started_at)
+
+    def test_incremental(self):
+        """只更新水位线之后修改过的对象，成功后前移水位线"""
+        self.set_watermark(timezone.now() - timedelta(hours=1))
+        started_at = timezone.now()
+        tasks.catch_up_index(self.backend, self.index, 1)
+        self.assertEqual(set(self.backend.documents), {self.identifier(self.article)})
+        self.assertGreaterEqual(IndexState.objects.get(index_name='articles.article').watermark, started_at)
+
+    def test_tombstones(self):
+        """删除水位线之后删除的对象，更早的删除记录已处理过"""
+        self.backend.update(self.index, Article.objects.filter(status='P'))
+        self.set_watermark(timezone.now() - timedelta(hours=1))
+        recent, old = self.identifier(self.article), self.identifier(self.old)
+        self.article.delete()
+        self.old.delete()
+        IndexTombstone.objects.filter(object_pk=old.rsplit('.', 1)[1]).update(
+            deleted_at=timezone.now() - timedelta(days=1))
+        tasks.catch_up_index(self.backend, self.index, 100)
+        self.assertNotIn(recent, self.backend.documents)
+        self.assertIn(old, self.backend.documents)
+
+    def test_purge_tombstones(self):
+        """所有索引的水位线之前的删除记录被清除"""
+        self.article.delete()
+        IndexTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=1))
+        tasks.catch_up_search_index()
+        self.assertFalse(IndexTombstone.objects.exists())
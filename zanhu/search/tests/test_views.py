@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from unittest import mock
+
+from django.core.cache import cache
+from haystack import connections
+from test_plus.test import TestCase
+
+from zanhu.articles.models import Article
+from zanhu.news.models import News
+from zanhu.search.views import SEARCH_CACHE_KEY, make_cache_key
+
+
+class TestSearchView(TestCase):
+
+    def setUp(self):
+        self.user = self.make_user('user01')
+        self.client.login(username='user01', password='password')
+        self.article = Article.objects.create(
+            user=self.user, title='搜索引擎入门', content='倒排索引', status='P')
+        self.news = News.objects.create(user=self.user, content='今天学习了搜索引擎')
+        self.backend = connections['default'].get_backend()
+        self.backend.clear()
+        unified_index = connections['default'].get_unified_index()
+        for model in (Article, News):
+            index = unified_index.get_index(model)
+            self.backend.update(index, index.index_queryset())
+
+    def tearDown(self):
+        self.backend.clear()
+        cache.clear()
+
+    def test_search(self):
+        """各类结果的数量来自分面统计，文章使用索引中存储的字段"""
+        response = self.get('search:search', data={'q': '搜索引擎'})
+        self.response_200(response)
+        self.assertEqual(response.context['articles_count'], 1)
+        self.assertEqual(response.context['news_count'], 1)
+        self.assertEqual(response.context['users_count'], 0)
+        self.assertEqual(response.context['articles_list'][0].title, '搜索引擎入门')
+        self.assertEqual(response.context['news_list'], [self.news])
+
+    def test_pagination(self):
+        """各类结果按?page=分页，只查询当前页"""
+        other = Article.objects.create(user=self.user, title='搜索引擎进阶', content='相关度', status='P')
+        index = connections['default'].get_unified_index().get_index(Article)
+        self.backend.update(index, [other])
+        with self.settings(HAYSTACK_SEARCH_RESULTS_PER_PAGE=1):
+            first = self.get('search:search', data={'q': '搜索引擎'})
+            second = self.get('search:search', data={'q': '搜索引擎', 'page': 2})
+            invalid = self.get('search:search', data={'q': '搜索引擎', 'page': 'x'})
+        self.assertEqual(first.context['articles_count'], 2)
+        self.assertEqual(first.context['articles_num_pages'], 2)
+        self.assertEqual(len(first.context['articles_list']), 1)
+        self.assertEqual(len(second.context['articles_list']), 1)
+        self.assertNotEqual(first.context['articles_list'][0].pk, second.context['articles_list'][0].pk)
+        self.assertEqual(second.context['page'], 2)
+        # 动态只有一页，第二页为空
+        self.assertEqual(second.context['news_list'], [])
+        self.assertContains(first, 'page=2')
+        self.assertEqual(invalid.context['page'], 1)
+
+    def test_cache(self):
+        """每页分别缓存，只是大小写或空白不同的查询共用缓存"""
+        self.get('search:search', data={'q': 'Django 搜索引擎'})
+        self.assertIsNotNone(cache.get(SEARCH_CACHE_KEY.format(make_cache_key('django 搜索引擎'), 1)))
+        self.assertIsNone(cache.get(SEARCH_CACHE_KEY.format(make_cache_key('django 搜索引擎'), 2)))
+        with mock.patch('zanhu.search.views.SearchQuerySet') as search_query_set:
+            self.get('search:search', data={'q': '  django   搜索引擎 '})
+            search_query_set.assert_not_called()
+            self.get('search:search', data={'q': 'django 搜索引擎', 'page': 2})
+            search_query_set.assert_called_once_with()
+
+    def test_query_display(self):
+        """页面显示用户输入的查询词，不显示规范化后的查询词"""
+        response = self.get('search:search', data={'q': '  Django搜索 '})
+        self.assertEqual(response.context['query'], 'Django搜索')
+
+    def test_autocomplete(self):
+        """自动补全按标题前缀匹配，只返回文章、用户和标签，并使用存储的字段"""
+        response = self.get('search:autocomplete', data={'q': '搜索'})
+        self.response_200(response)
+        self.assertEqual(response.json()['suggestions'], [
+            {'type': 'article', 'label': '搜索引擎入门', 'url': f'/articles/{self.article.slug}/'}])
+        # 标题中间的词不是前缀，不补全
+        response = self.get('search:autocomplete', data={'q': '引擎'})
+        self.assertEqual(response.json()['suggestions'], [])
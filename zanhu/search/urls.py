@@ -0,0 +1,14 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from django.urls import path
+
+from zanhu.search import views
+
+app_name = 'search'
+
+urlpatterns = [
+    path('', views.SearchView.as_view(), name='search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+]
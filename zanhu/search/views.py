@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import hashlib
+import math
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+from django.views.generic import TemplateView
+from haystack.query import SearchQuerySet
+from haystack.utils import get_model_ct
+from taggit.models import Tag
+
+from zanhu.articles.models import Article
+from zanhu.news.models import News
+from zanhu.qa.models import Question
+
+SEARCH_CACHE_KEY = 'search:results:{}:{}'  # 搜索结果，按查询词和页码
+AUTOCOMPLETE_CACHE_KEY = 'search:autocomplete:{}'  # 自动补全的建议
+
+
+def normalize_query(query):
+    """规范化查询词：去掉首尾空白，合并连续空白，英文转为小写"""
+    return ' '.join(query.split()).lower()
+
+
+def make_cache_key(query):
+    """按规范化的查询词生成缓存键，只是大小写或空白不同的查询共用缓存；查询词可能包含缓存键不允许的字符，使用摘要"""
+    return hashlib.md5(normalize_query(query).encode('utf-8')).hexdigest()
+
+
+def load_objects(queryset, results):
+    """按搜索结果的顺序加载数据库对象，每个模型类只查询一次"""
+    objects = {str(pk): obj for pk, obj in queryset.in_bulk([result.pk for result in results]).items()}
+    return [objects[result.pk] for result in results if result.pk in objects]
+
+
+class SearchView(TemplateView):
+    """全站搜索，一次分面查询得到各类结果的数量，有结果的类别再分别查询"""
+    template_name = 'search/search_results.html'
+
+    def get_search_models(self):
+        """结果类别及其模型类"""
+        return [
+            ('articles', Article),
+            ('news', News),
+            ('questions', Question),
+            ('users', get_user_model()),
+            ('tags', Tag),
+        ]
+
+    def get_page(self):
+        """?page=N，各类结果使用同一个页码，无效的页码视为第一页"""
+        try:
+            return max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            return 1
+
+    def get_search_results(self, query, page=1):
+        """
+        查询搜索引擎，结果按规范化的查询词和页码缓存，热门搜索不重复请求搜索引擎
+        :return: {类别: (数量, 当前页的搜索结果列表)}
+        """
+        key = SEARCH_CACHE_KEY.format(make_cache_key(query), page)
+        results = cache.get(key)
+        if results is not None:
+            return results
+        sqs = SearchQuerySet().auto_query(query)
+        counts = dict(sqs.facet('django_ct').facet_counts().get('fields', {}).get('django_ct', []))
+        limit = settings.HAYSTACK_SEARCH_RESULTS_PER_PAGE
+        offset = (page - 1) * limit
+        results = {}
+        for name, model in self.get_search_models():
+            count = counts.get(get_model_ct(model), 0)
+            # 只向搜索引擎请求当前页，超出该类结果数量的页码不再查询
+            results[name] = (count, list(sqs.models(model)[offset:offset + limit]) if count > offset else [])
+        cache.set(key, results, settings.SEARCH_CACHE_TIMEOUT)
+        return results
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        page = self.get_page()
+        context['query'] = query  # 页面显示用户输入的查询词，只有缓存键使用规范化的查询词
+        context['page'] = page
+        results = self.get_search_results(query, page) if query else {}
+        for name, _ in self.get_search_models():
+            context[f'{name}_count'], context[f'{name}_list'] = results.get(name, (0, []))
+            context[f'{name}_num_pages'] = math.ceil(
+                context[f'{name}_count'] / settings.HAYSTACK_SEARCH_RESULTS_PER_PAGE)
+        # 文章、用户和标签使用索引中存储的字段，动态和问题的模板需要完整的对象，不缓存以保证点赞数等是最新的
+        context['news_list'] = load_objects(
+            News.objects.select_related('user').prefetch_related('liked'), context['news_list'])
+        context['questions_list'] = load_objects(
+            Question.objects.select_related('user'), context['questions_list'])
+        return context
+
+
+def get_suggestion(result):
+    """自动补全的一条建议，只使用索引中存储的字段"""
+    if result.model_name == 'article':
+        return {'type': 'article', 'label': result.title, 'url': reverse('articles:article', args=[result.slug])}
+    if result.model_name == 'tag':
+        return {'type': 'tag', 'label': result.name, 'url': None}
+    return {'type': 'user', 'label': result.profile_name, 'url': reverse('users:detail', args=[result.username])}
+
+
+@require_http_methods(['GET'])
+def autocomplete(request):
+    """搜索框自动补全：匹配文章标题、标签和用户名的前缀，结果单独缓存"""
+    query = request.GET.get('q', '').strip()
+    if len(query) < settings.SEARCH_AUTOCOMPLETE_MIN_LENGTH:
+        return JsonResponse({'suggestions': []})
+    key = AUTOCOMPLETE_CACHE_KEY.format(make_cache_key(query))
+    suggestions = cache.get(key)
+    if suggestions is None:
+        sqs = SearchQuerySet().models(Article, get_user_model(), Tag).autocomplete(autocomplete=query)
+        suggestions = [get_suggestion(result) for result in sqs[:settings.SEARCH_AUTOCOMPLETE_LIMIT]]
+        cache.set(key, suggestions, settings.SEARCH_AUTOCOMPLETE_CACHE_TIMEOUT)
+    return JsonResponse({'suggestions': suggestions})
@@ -15,4 +15,25 @@ $(function () {
         $("input[name='status']").val("D");
         $("#article-form").submit();
     });
+
+    // 草稿自动保存，停止输入3秒后发送，服务端再将短时间内的多次保存合并写入
+    const autosaveUrl = $("#article-form").data("autosave-url");
+    let autosaveTimer = null;
+    if (autosaveUrl) {
+        $("#article-form").on("input", "input[name='title'], textarea[name='content']", function () {
+            clearTimeout(autosaveTimer);
+            autosaveTimer = setTimeout(function () {
+                $.ajax({
+                    url: autosaveUrl,
+                    data: {
+                        'title': $("input[name='title']").val(),
+                        'content': $("textarea[name='content']").val(),
+                        'csrfmiddlewaretoken': $("input[name='csrfmiddlewaretoken']").val()
+                    },
+                    cache: false,
+                    type: 'POST'
+                });
+            }, 3000);
+        });
+    }
 });
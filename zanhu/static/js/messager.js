@@ -6,32 +6,124 @@ $(function () {
         $('.messages-list').scrollTop($('.messages-list')[0].scrollHeight);
     }
 
-    // AJAX POST发送消息
-    $("#send").submit(function () {
+    // 转义HTML特殊字符
+    function escapeHtml(text) {
+        return $('<div>').text(text).html();
+    }
+
+    // 根据后端推送的私信数据渲染一条消息，与messager/single_message.html结构一致
+    function renderMessage(message) {
+        const picture = message.picture
+            ? '<img class="picture" src="' + escapeHtml(message.picture) + '" height="45px" alt="用户头像">'
+            : '<img class="picture" src="/static/img/user.png" height="45px" alt="没有头像"/>';
+        return '<li>' + picture + '<div><b><a href="/users/' + encodeURIComponent(message.sender) + '/">' +
+            escapeHtml(message.sender_name) + '</a></b><small> - ' + escapeHtml(message.created_at) +
+            '</small><br>' + escapeHtml(message.text) + '</div></li>';
+    }
+
+    // 使用wss（https）或者ws（http）
+    const ws_scheme = window.location.protocol === "https:" ? "wss" : "ws";
+    const ws_path = ws_scheme + "://" + window.location.host + "/ws/" + currentUser + "/";
+    const ws = new ReconnectingWebSocket(ws_path);
+    let clientId = 0;  // 通过WebSocket发送的消息编号，用于匹配服务端的确认
+    const pending = {};  // 已发送、尚未确认的消息，client_id -> 消息内容
+
+    // 每30秒发送一次心跳，保持在线状态
+    setInterval(function () {
+        if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({'type': 'heartbeat'}));
+        }
+    }, 30000);
+
+    // AJAX POST发送消息，WebSocket不可用时使用
+    function sendMessageByAjax() {
         $.ajax({
             url: '/messages/send-message/',
             data: $("#send").serialize(),
             cache: false,
             type: 'POST',
             success: function (data) {
-                $(".send-message").before(data);  // 将接收到的消息插入到聊天框
+                $(".send-message").before(renderMessage(data));  // 将发送的消息插入到聊天框
                 $("input[name='message']").val(''); // 消息发送框置为空
                 scrollConversationScreen();  // 滚动条下拉到底
             }
         });
+    }
+
+    // 优先通过WebSocket直接发送消息，收到服务端确认后插入聊天框
+    $("#send").submit(function () {
+        const message = $("input[name='message']").val();
+        if (ws.readyState !== WebSocket.OPEN) {
+            sendMessageByAjax();
+            return false;
+        }
+        clientId += 1;
+        pending[clientId] = message;
+        ws.send(JSON.stringify({
+            'client_id': clientId,
+            'to': $("input[name='to']").val(),
+            'message': message
+        }));
+        $("input[name='message']").val(''); // 消息发送框置为空
+        return false;
+    });
+
+    // 将当前会话标为已读
+    function markConversationAsRead() {
+        $.ajax({
+            url: '/messages/' + activeUser + '/mark-as-read/',
+            data: {'csrfmiddlewaretoken': $("input[name='csrfmiddlewaretoken']").val()},
+            cache: false,
+            type: 'POST'
+        });
+    }
+
+    // 加载更早的消息（包括已归档的消息），使用后端返回的游标分页
+    $(".messages-list").on("click", ".load-older a", function () {
+        const link = $(this);
+        const list = $(".messages-list");
+        $.ajax({
+            url: '/messages/' + activeUser + '/older/',
+            data: {'cursor': link.data('cursor')},
+            cache: false,
+            type: 'GET',
+            success: function (data) {
+                const previousHeight = list[0].scrollHeight;
+                $(".load-older").after(data.messages);
+                list.scrollTop(list[0].scrollHeight - previousHeight);  // 保持当前阅读位置
+                if (data.cursor) {
+                    link.data('cursor', data.cursor);
+                } else {
+                    $(".load-older").remove();
+                }
+            }
+        });
         return false;
     });
 
-    // 使用wss（https）或者ws（http）
-    const ws_scheme = window.location.protocol === "https:" ? "wss" : "ws";
-    const ws_path = ws_scheme + "://" + window.location.host + "/ws/" + currentUser + "/";
-    const ws = new ReconnectingWebSocket(ws_path);
     // 监听后端发送过来的消息
     ws.onmessage = function (event) {
         const data = JSON.parse(event.data);
-        if (data.sender === activeUser) {  // 发送者为当前选中的用户
-            $(".send-message").before(data.message);  // 将接收到的消息插入到聊天框
-            scrollConversationScreen();  // 滚动条下拉到底部
+        switch (data.type) {
+            case 'ack':  // 自己发送的消息已保存
+                delete pending[data.client_id];
+                $(".send-message").before(renderMessage(data.message));
+                scrollConversationScreen();
+                break;
+            case 'error':  // 消息保存失败，将内容放回发送框以便重新发送
+                if (data.client_id in pending) {
+                    $("input[name='message']").val(pending[data.client_id]);
+                    delete pending[data.client_id];
+                }
+                alert('消息发送失败，请重试！');
+                break;
+            case 'message':
+                if (data.message.sender === activeUser) {  // 发送者为当前选中的用户
+                    $(".send-message").before(renderMessage(data.message));  // 将接收到的消息插入到聊天框
+                    scrollConversationScreen();  // 滚动条下拉到底部
+                    markConversationAsRead();  // 正在查看的会话，收到的消息直接标为已读
+                }
+                break;
         }
     }
 });
@@ -1,14 +1,16 @@
 $(function () {
-    const emptyMessage = '没有未读通知';
     const notice = $('#notifications');
 
+    // 只请求未读通知数，服务端从缓存读取
     function CheckNotifications() {
         $.ajax({
-            url: '/notifications/latest-notifications/',
+            url: '/notifications/unread-count/',
             cache: false,
             success: function (data) {
-                if (!data.includes(emptyMessage)) {
+                if (data.count > 0) {
                     notice.addClass('btn-danger');
+                } else {
+                    notice.removeClass('btn-danger');
                 }
             },
         });
@@ -60,23 +62,30 @@ $(function () {
     const ws_path = ws_scheme + '://' + window.location.host + '/ws/notifications/';
     const ws = new ReconnectingWebSocket(ws_path);
 
-    // 监听后端发送过来的消息
+    // 每30秒发送一次心跳，保持在线状态
+    setInterval(function () {
+        if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({'type': 'heartbeat'}));
+        }
+    }, 30000);
+
+    // 监听后端发送过来的消息，通知与轮询接口的结构相同，key区分事件类型
     ws.onmessage = function (event) {
         const data = JSON.parse(event.data);
         switch (data.key) {
             case 'notification':
-                if (currentUser !== data.actor_name) {
+                if (currentUser !== data.actor) {
                     notice.addClass('btn-danger');
                 }
                 break;
             case 'social_update':
-                if (currentUser !== data.actor_name) {
+                if (currentUser !== data.actor) {
                     notice.addClass('btn-danger');
                 }
                 update_social_activity(data.id_value);
                 break;
             case 'additional_news':
-                if (currentUser !== data.actor_name) {
+                if (currentUser !== data.actor) {
                     $('.stream-update').show();
                 }
                 break;
@@ -0,0 +1,20 @@
+$(function () {
+    // 搜索框自动补全，服务端缓存了每个前缀的建议
+    $('#searchInput').autocomplete({
+        minLength: 2,
+        delay: 200,
+        source: function (request, response) {
+            $.getJSON('/search/autocomplete/', {'q': request.term}, function (data) {
+                response($.map(data.suggestions, function (item) {
+                    return {'label': item.label, 'value': item.label, 'url': item.url};
+                }));
+            });
+        },
+        select: function (event, ui) {
+            if (ui.item.url) {
+                window.location.href = ui.item.url;
+                return false;
+            }
+        }
+    });
+});
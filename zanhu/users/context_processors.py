@@ -0,0 +1,13 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from zanhu.users.presence import presence
+
+
+def online_users(request):
+    """模板中的在线用户数和在线用户列表，传入可调用对象，只有模板用到时才查询"""
+    return {
+        'online_count': presence.get_online_count,
+        'online_users': presence.get_online_users,
+    }
@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from zanhu.articles.models import Article
+from zanhu.articles.tasks import process_article_image
+from zanhu.users.tasks import process_user_picture
+
+
+class Command(BaseCommand):
+    help = '为已上传的文章图片和用户头像生成衍生图，每张图片发送一个Celery任务在后台处理'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='重新生成所有图片的衍生图，默认只处理还没有衍生图的图片')
+
+    def handle(self, *args, **options):
+        targets = [
+            ('文章图片', Article.objects.exclude(image=''), 'image_derivatives', process_article_image),
+            ('用户头像', get_user_model().objects.exclude(picture='').exclude(picture__isnull=True),
+             'picture_derivatives', process_user_picture),
+        ]
+        for name, qs, field, task in targets:
+            if not options['all']:
+                qs = qs.filter(Q(**{f'{field}__isnull': True}) | Q(**{field: ''}))
+            count = 0
+            for pk in qs.order_by('pk').values_list('pk', flat=True).iterator():
+                task.delay(pk)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f'{name}: 已发送{count}个生成衍生图的任务'))
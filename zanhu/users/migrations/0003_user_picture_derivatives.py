@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20210706_2204'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='picture_derivatives',
+            field=models.TextField(blank=True, null=True, verbose_name='头像衍生图'),
+        ),
+    ]
@@ -2,9 +2,12 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
+import json
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.urls import reverse
+from django.utils.functional import cached_property
 
 
 class User(AbstractUser):
@@ -13,6 +16,7 @@ class User(AbstractUser):
     job_title = models.CharField('职称', max_length=32, blank=True, null=True)
     introduction = models.TextField('简介', blank=True, null=True)
     picture = models.ImageField('头像', upload_to='profile_pics/', blank=True, null=True)
+    picture_derivatives = models.TextField('头像衍生图', blank=True, null=True)  # JSON，由Celery任务生成
     location = models.CharField('地址', max_length=128, blank=True, null=True)
     personal_url = models.URLField('个人链接', max_length=255, blank=True, null=True)
     weibo = models.URLField('微博', max_length=255, blank=True, null=True)
@@ -35,3 +39,8 @@ class User(AbstractUser):
 
     def get_profile_name(self):
         return self.nickname if self.nickname else self.username
+
+    @cached_property
+    def picture_urls(self):
+        """头像各尺寸衍生图的URL，尚未生成时为空字典"""
+        return json.loads(self.picture_derivatives) if self.picture_derivatives else {}
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+"""
+用户在线状态
+
+WebSocket连接建立、心跳和断开时由consumer调用，每个连接带有过期时间，
+进程异常退出没有触发disconnect时，连接在心跳超时后自动视为离线。
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+
+class RedisPresence:
+    """使用Redis有序集合记录在线状态，分值为过期时间戳"""
+    online_key = 'presence:online'  # 在线用户名 -> 最晚的过期时间
+    connections_key = 'presence:connections:{}'  # 用户的各个连接 -> 过期时间
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    @property
+    def redis(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    def connect(self, username, channel_name):
+        """连接建立或收到心跳时，刷新连接和用户的过期时间"""
+        expires = time.time() + self.timeout
+        key = self.connections_key.format(username)
+        pipe = self.redis.pipeline()
+        pipe.zadd(key, {channel_name: expires})
+        pipe.expire(key, self.timeout)
+        pipe.zadd(self.online_key, {username: expires})
+        pipe.execute()
+
+    heartbeat = connect
+
+    def disconnect(self, username, channel_name):
+        """连接断开，用户没有其他未过期的连接时标记为离线"""
+        key = self.connections_key.format(username)
+        pipe = self.redis.pipeline()
+        pipe.zrem(key, channel_name)
+        pipe.zremrangebyscore(key, '-inf', time.time())
+        pipe.zcard(key)
+        if not pipe.execute()[-1]:
+            self.redis.zrem(self.online_key, username)
+
+    def get_online_users(self, limit=None):
+        """在线用户名列表，最近活跃的在前"""
+        redis = self.redis
+        redis.zremrangebyscore(self.online_key, '-inf', time.time())  # 清理心跳超时的用户
+        return [name.decode() for name in redis.zrevrange(self.online_key, 0, limit - 1 if limit else -1)]
+
+    def get_online_count(self):
+        """在线用户数，O(log(N))"""
+        return self.redis.zcount(self.online_key, time.time(), '+inf')
+
+    def filter_online(self, usernames):
+        """返回给定用户名中在线的用户名集合，一次往返"""
+        usernames = list(usernames)
+        pipe = self.redis.pipeline()
+        for username in usernames:
+            pipe.zscore(self.online_key, username)
+        now = time.time()
+        return {username for username, expires in zip(usernames, pipe.execute()) if expires and expires > now}
+
+
+class LocalPresence:
+    """进程内记录在线状态，用于测试和没有Redis的开发环境"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._connections = {}  # 用户名 -> {连接: 过期时间}
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for username in list(self._connections):
+            channels = {name: expires for name, expires in self._connections[username].items() if expires > now}
+            if channels:
+                self._connections[username] = channels
+            else:
+                del self._connections[username]
+
+    def connect(self, username, channel_name):
+        with self._lock:
+            self._connections.setdefault(username, {})[channel_name] = time.time() + self.timeout
+
+    heartbeat = connect
+
+    def disconnect(self, username, channel_name):
+        with self._lock:
+            self._connections.get(username, {}).pop(channel_name, None)
+            self._expire(time.time())
+
+    def get_online_users(self, limit=None):
+        with self._lock:
+            self._expire(time.time())
+            users = sorted(self._connections, key=lambda name: max(self._connections[name].values()), reverse=True)
+        return users[:limit] if limit else users
+
+    def get_online_count(self):
+        return len(self.get_online_users())
+
+    def filter_online(self, usernames):
+        return set(usernames) & set(self.get_online_users())
+
+    def clear(self):
+        with self._lock:
+            self._connections.clear()
+
+
+presence = SimpleLazyObject(lambda: import_string(settings.PRESENCE_BACKEND)(settings.PRESENCE_TIMEOUT))
@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from zanhu.taskapp.celery import app
+from zanhu.helpers import make_image_derivatives
+
+
+@app.task(ignore_result=True)
+def process_user_picture(user_id):
+    """上传头像后生成各尺寸衍生图，并记录衍生图的URL"""
+    User = get_user_model()
+    user = User.objects.filter(pk=user_id).only('picture').first()
+    if user is None or not user.picture:
+        return
+    derivatives = make_image_derivatives(user.picture, settings.USER_PICTURE_SIZES)
+    # 使用update，不触发save方法；更新updated_at，索引中存储的图片URL由增量更新刷新
+    User.objects.filter(pk=user_id).update(picture_derivatives=json.dumps(derivatives), updated_at=timezone.now())
@@ -2,12 +2,26 @@
 # -*- coding:utf-8 -*-
 # __author__ = '__AYC__'
 
+import shutil
+import tempfile
+from unittest import mock
+
+from PIL import Image
 from test_plus.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import override_settings
+
+from zanhu.users.tasks import process_user_picture
 
 
 class TestUserModel(TestCase):
     def setUp(self):
         self.user = self.make_user()
+        self.media_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
 
     def test__str__(self):
         self.assertEqual(self.user.__str__(), 'testuser')
@@ -19,3 +33,35 @@ class TestUserModel(TestCase):
         self.assertEqual(self.user.get_profile_name(), 'testuser')
         self.user.nickname = 'nickname'
         self.assertEqual(self.user.get_profile_name(), 'nickname')
+
+    def test_picture_urls(self):
+        """尚未生成衍生图时为空字典"""
+        self.assertEqual(self.user.picture_urls, {})
+
+    def save_picture(self):
+        with tempfile.TemporaryFile() as f:
+            Image.new('RGB', (200, 100), (255, 0, 0)).save(f, 'PNG')
+            f.seek(0)
+            self.user.picture.save('picture.png', ContentFile(f.read()))
+
+    @override_settings(IMAGE_DERIVATIVE_FORMAT='JPEG', USER_PICTURE_SIZES={'x50': (None, 50)})
+    def test_process_user_picture(self):
+        """上传头像后生成衍生图"""
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.save_picture()
+            process_user_picture(self.user.pk)
+        self.user.refresh_from_db()
+        self.assertIn('x50', self.user.picture_urls)
+        self.assertTrue(self.user.picture_urls['x50'].endswith('_x50.jpeg'))
+
+    def test_backfill_image_derivatives(self):
+        """只为还没有衍生图的已有头像发送任务"""
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.save_picture()
+        done = self.make_user('user02')
+        done.picture = 'profile_pics/done.png'
+        done.picture_derivatives = '{"x50": "/media/done_x50.webp"}'
+        done.save()
+        with mock.patch.object(process_user_picture, 'delay') as delay:
+            call_command('backfill_image_derivatives', stdout=mock.Mock())
+        delay.assert_called_once_with(self.user.pk)
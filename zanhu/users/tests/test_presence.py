@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+# __author__ = '__AYC__'
+
+from unittest import mock
+
+from test_plus.test import TestCase
+
+from zanhu.users.presence import LocalPresence
+
+
+class TestLocalPresence(TestCase):
+
+    def setUp(self):
+        self.presence = LocalPresence(timeout=90)
+        self.presence.connect('user01', 'channel-1')
+        self.presence.connect('user01', 'channel-2')
+        self.presence.connect('user02', 'channel-3')
+
+    def test_online_users(self):
+        self.assertEqual(self.presence.get_online_count(), 2)
+        self.assertEqual(set(self.presence.get_online_users()), {'user01', 'user02'})
+        self.assertEqual(len(self.presence.get_online_users(limit=1)), 1)
+        self.assertEqual(self.presence.filter_online(['user01', 'user03']), {'user01'})
+
+    def test_disconnect(self):
+        """所有连接都断开后才视为离线"""
+        self.presence.disconnect('user01', 'channel-1')
+        self.assertIn('user01', self.presence.get_online_users())
+        self.presence.disconnect('user01', 'channel-2')
+        self.assertEqual(self.presence.get_online_users(), ['user02'])
+
+    def test_heartbeat_expiry(self):
+        """心跳超时的连接视为离线"""
+        with mock.patch('zanhu.users.presence.time.time', return_value=10 ** 10):
+            self.presence.heartbeat('user02', 'channel-3')
+            self.assertEqual(self.presence.get_online_users(), ['user02'])
@@ -4,9 +4,12 @@
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
 from django.urls import reverse
 from django.views.generic import DetailView, UpdateView
 
+from zanhu.users.tasks import process_user_picture
+
 User = get_user_model()
 
 
@@ -44,6 +47,17 @@ class UserUpdateView(LoginRequiredMixin, UpdateView):
               'personal_url', 'weibo', 'zhihu', 'github', 'linkedin']
     template_name = 'users/user_form.html'
 
+    def form_valid(self, form):
+        """头像有更新时，事务提交后异步生成头像衍生图"""
+        picture_changed = 'picture' in form.changed_data
+        if picture_changed:
+            form.instance.picture_derivatives = None  # 旧的衍生图作废，生成新的衍生图前使用原图
+        response = super().form_valid(form)
+        if picture_changed and self.object.picture:
+            user_id = self.object.pk
+            transaction.on_commit(lambda: process_user_picture.delay(user_id))
+        return response
+
     def get_success_url(self):
         """更新成功后跳转到个人详情页"""
         return reverse("users:detail", kwargs={"username": self.request.user.username})